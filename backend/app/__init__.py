@@ -1 +1,13 @@
 # MediScan AI Backend
+import os
+
+from app.core.config import settings
+
+# Keep every worker on the configured cores (one NUMA node) to avoid cross-socket memory traffic
+if settings.CPU_AFFINITY and hasattr(os, "sched_setaffinity"):
+    os.sched_setaffinity(0, settings.cpu_affinity)
+
+# Size the OpenMP / MKL pools before torch or onnxruntime is imported, so uvicorn
+# workers do not each spin up one thread per core and oversubscribe the CPU.
+os.environ.setdefault("OMP_NUM_THREADS", str(settings.inference_threads))
+os.environ.setdefault("MKL_NUM_THREADS", str(settings.inference_threads))
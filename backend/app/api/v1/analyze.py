@@ -6,15 +6,22 @@ from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Backgro
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from typing import List, Dict, Optional
+import asyncio
+import io
 import uuid
 import logging
+import time
 from datetime import datetime
 
+from app.core.config import settings
 from app.core.security import get_current_user
-from app.models.densenet import get_vision_model
-from app.models.biogpt import get_report_generator
+from app.models.densenet import (
+    HEATMAP_CONTENT_TYPES, get_grad_cam_batcher, get_vision_model, get_vision_batcher,
+)
+from app.models.biogpt import NORMAL_REPORT, get_report_batcher
 from app.services.storage import get_storage_service
 from app.services.fhir import generate_fhir_report
+from app.services.anonymize import PNG_SIGNATURE, sanitize_image
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -55,6 +62,7 @@ SEVERITY_COLORS = {
     "MILD": "#65A30D",     # lime-600
     "NORMAL": "#16A34A",   # green-600
 }
+_DEFAULT_COLOR = SEVERITY_COLORS["NORMAL"]
 
 
 @router.post("/analyze", response_model=AnalysisResponse)
@@ -70,7 +78,7 @@ async def analyze_scan(
     - Returns 14-pathology detection, severity triage, structured report, and Grad-CAM heatmap URL
     - HIPAA: image anonymised (EXIF stripped), stored encrypted in Azure Blob, auto-deleted after 30 days
     """
-    start_time = datetime.utcnow()
+    start_time = time.perf_counter()
 
     # Validate file type
     if file.content_type not in ALLOWED_CONTENT_TYPES:
@@ -79,54 +87,106 @@ async def analyze_scan(
             detail=f"Unsupported file type: {file.content_type}. Accepted: JPEG, PNG",
         )
 
-    image_bytes = await file.read()
-
-    # Validate file size
-    if len(image_bytes) > MAX_FILE_SIZE_BYTES:
+    # Validate file size before reading the spooled upload (its actual size on disk / in
+    # memory when the parser did not record one — Content-Length covers the whole form)
+    file_size = file.size
+    if file_size is None:
+        file.file.seek(0, io.SEEK_END)
+        file_size = file.file.tell()
+    if file_size > MAX_FILE_SIZE_BYTES:
         raise HTTPException(status_code=413, detail="File too large. Maximum size: 10MB")
 
+    # Anonymise: drop EXIF / IPTC / text metadata before the image goes anywhere.
+    # Streamed from the spooled upload, so only the cleaned copy is held in memory.
+    # CPU-bound steps run in worker threads so concurrent requests keep reaching the batchers.
+    file.file.seek(0)
+    try:
+        image_bytes = await asyncio.to_thread(sanitize_image, file.file)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image file: {e}")
+
     scan_id = str(uuid.uuid4())
     logger.info(f"[{scan_id}] Analysis started for user: {current_user['sub']}")
 
+    # Every in-flight upload, so a failed analysis leaves no blobs written behind it
+    uploads: List[asyncio.Task] = []
     try:
-        # 1. Vision model — pathology detection + Grad-CAM
-        vision_model = get_vision_model()
-        vision_result = vision_model.predict(image_bytes)
-
-        # 2. Generate Grad-CAM heatmap overlay
-        heatmap_png = vision_model.generate_heatmap_overlay(
-            image_bytes, vision_result["heatmap"]
-        )
-
-        # 3. NLP report generation
-        report_gen = get_report_generator()
-        report_sections = report_gen.generate_report(
-            conditions=vision_result["conditions"],
-            severity=vision_result["severity"],
-        )
-
-        # 4. Upload heatmap to Azure Blob (encrypted)
+        # 0. Store the anonymised original (encrypted) while the models run
         storage = get_storage_service()
-        heatmap_url = await storage.upload_bytes(
-            data=heatmap_png,
-            blob_name=f"{scan_id}/heatmap.png",
-            content_type="image/png",
+        original_ext, original_type = (
+            ("png", "image/png") if image_bytes.startswith(PNG_SIGNATURE) else ("jpg", "image/jpeg")
         )
-
-        # 5. Generate FHIR DiagnosticReport
+        original_upload = asyncio.create_task(storage.upload_bytes(
+            data=image_bytes,
+            blob_name=f"{scan_id}/original.{original_ext}",
+            content_type=original_type,
+        ))
+        uploads.append(original_upload)
+
+        # 1. Vision model — pathology detection + Grad-CAM (batched with concurrent requests)
+        vision_model = get_vision_model()
+        image = await asyncio.to_thread(vision_model.preprocess, image_bytes)
+        vision_result = await get_vision_batcher().submit(image)
+
+        if vision_result["is_normal"]:
+            # 2–3. Healthy scan: no hotspot to explain and the report is fixed text
+            heatmap_image = None
+            report_sections = NORMAL_REPORT
+        else:
+            # 2–3. NLP report generation (batched with concurrent requests), overlapped with
+            # Grad-CAM when it was not already computed by the classification forward
+            report_request = get_report_batcher().submit({
+                "conditions": vision_result["conditions"],
+                "severity": vision_result["severity"],
+            })
+            heatmap = vision_result["heatmap"]
+            if heatmap is None:
+                heatmap, report_sections = await asyncio.gather(
+                    get_grad_cam_batcher().submit(
+                        (vision_result["image"], vision_result["class_index"])
+                    ),
+                    report_request,
+                )
+            else:
+                report_sections = await report_request
+
+            # Grad-CAM heatmap overlay
+            heatmap_image = await asyncio.to_thread(
+                vision_model.generate_heatmap_overlay, vision_result["image"], heatmap
+            )
+
+        # 4. Upload heatmap to Azure Blob (encrypted) while the FHIR report is built
+        heatmap_upload = None
+        if heatmap_image is not None:
+            heatmap_upload = asyncio.create_task(storage.upload_bytes(
+                data=heatmap_image,
+                blob_name=f"{scan_id}/heatmap.{settings.HEATMAP_FORMAT}",
+                content_type=HEATMAP_CONTENT_TYPES[settings.HEATMAP_FORMAT],
+            ))
+            uploads.append(heatmap_upload)
+
+        # 5. Generate FHIR DiagnosticReport, uploaded concurrently with the heatmap
         fhir_report = generate_fhir_report(
             scan_id=scan_id,
             conditions=vision_result["conditions"],
             report_sections=report_sections,
             severity=vision_result["severity"],
         )
-        fhir_url = await storage.upload_bytes(
-            data=fhir_report.encode(),
+        fhir_upload = asyncio.create_task(storage.upload_bytes(
+            data=fhir_report,
             blob_name=f"{scan_id}/report.fhir.json",
             content_type="application/fhir+json",
-        )
-
-        processing_ms = (datetime.utcnow() - start_time).total_seconds() * 1000
+        ))
+        uploads.append(fhir_upload)
+        if heatmap_upload is None:
+            heatmap_url = None
+            _, fhir_url = await asyncio.gather(original_upload, fhir_upload)
+        else:
+            _, heatmap_url, fhir_url = await asyncio.gather(
+                original_upload, heatmap_upload, fhir_upload
+            )
+
+        processing_ms = (time.perf_counter() - start_time) * 1000
 
         logger.info(
             f"[{scan_id}] Analysis complete | severity={vision_result['severity']} | "
@@ -136,9 +196,10 @@ async def analyze_scan(
         return AnalysisResponse(
             scan_id=scan_id,
             severity=vision_result["severity"],
-            severity_color=SEVERITY_COLORS.get(vision_result["severity"], "#16A34A"),
+            severity_color=SEVERITY_COLORS.get(vision_result["severity"], _DEFAULT_COLOR),
             conditions=vision_result["conditions"],
-            report=ReportSection(**report_sections),
+            # Report sections come from the generator in exactly this shape — skip re-validation
+            report=ReportSection.model_construct(**report_sections),
             heatmap_url=heatmap_url,
             fhir_report_url=fhir_url,
             generated_at=datetime.utcnow().isoformat(),
@@ -146,5 +207,9 @@ async def analyze_scan(
         )
 
     except Exception as e:
+        pending = [upload for upload in uploads if not upload.done()]
+        for upload in pending:
+            upload.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
         logger.error(f"[{scan_id}] Analysis failed: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail="Analysis pipeline failed. Please try again.")
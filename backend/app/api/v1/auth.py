@@ -2,7 +2,7 @@
 
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel, EmailStr
-from app.core.security import create_access_token, hash_password, verify_password
+from app.core.security import create_access_token, verify_password
 
 router = APIRouter()
 
@@ -17,10 +17,11 @@ class TokenResponse(BaseModel):
     token_type: str = "bearer"
 
 
-# In production, replace with a real database
+# In production, replace with a real database.
+# Hashes are precomputed (hash_password("demo1234")) so importing this module runs no KDF.
 DEMO_USERS = {
     "demo@mediscan.ai": {
-        "hashed_password": hash_password("demo1234"),
+        "hashed_password": "$argon2id$v=19$m=19456,t=2,p=1$zHQyVtznC0N3iIZ1GfJfpQ$h6S/k/9orR92x4lufW6L1kuNazvweKXzBVen2K67Ngs",
         "role": "clinician",
         "user_id": "demo-user-001",
     }
@@ -1,5 +1,6 @@
+import os
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import List, Literal, Set
 
 
 class Settings(BaseSettings):
@@ -32,9 +33,55 @@ class Settings(BaseSettings):
     DENSENET_MODEL: str = "densenet121-res224-chex"  # torchxrayvision model key
     MAX_IMAGE_SIZE_MB: int = 10
 
+    # Inference runtime
+    VISION_BACKEND: str = "onnx"  # "onnx" (ONNX Runtime) or "torch" (eager PyTorch)
+    USE_GPU: bool = False  # CUDA + FP16 + channels_last for the PyTorch model
+    TORCH_COMPILE: bool = False  # torch.compile the PyTorch classification forward
+    TORCH_COMPILE_BACKEND: str = "inductor"  # or "openvino" (needs openvino installed)
+    # Cached checkpoints and exported / quantized ONNX graphs; must be writable only by the app user
+    MODEL_CACHE_DIR: str = os.path.join(os.path.expanduser("~"), ".cache", "mediscan", "models")
+    CALIBRATION_IMAGE_DIR: str = ""  # CheXpert images for static INT8 calibration
+    CALIBRATION_MAX_IMAGES: int = 500
+    VISION_INT8: bool = True  # serve the static INT8 graph on CPU when calibration data exists
+    REPORT_BACKEND: str = "onnx"  # "onnx" (ONNX Runtime INT8 BioGPT) or "torch" (eager)
+    HEATMAP_FORMAT: Literal["png", "webp"] = "webp"  # webp: lossy, fast SIMD encode; png: lossless
+    WARMUP_MODELS: bool = True  # load + run a dummy inference at startup
+
+    # Threading — each uvicorn worker gets an equal share of the cores
+    UVICORN_WORKERS: int = 2
+    INFERENCE_THREADS: int = 0  # 0 = usable CPUs // UVICORN_WORKERS
+    CPU_AFFINITY: str = ""  # e.g. "0-15" — pin workers to one NUMA node's cores
+
+    # Dynamic batching of concurrent /analyze requests
+    BATCH_MAX_SIZE: int = 8
+    BATCH_MAX_WAIT_MS: int = 10
+
     # HIPAA audit log retention (days)
     AUDIT_LOG_RETENTION_DAYS: int = 2190  # 6 years per HIPAA §164.312(b)
 
+    @property
+    def cpu_affinity(self) -> Set[int]:
+        """CPU_AFFINITY parsed from a Linux cpulist ("0-3,8-11") into CPU ids."""
+        cpus = set()
+        for part in filter(None, self.CPU_AFFINITY.replace(" ", "").split(",")):
+            first, _, last = part.partition("-")
+            cpus.update(range(int(first), int(last or first) + 1))
+        return cpus
+
+    @property
+    def inference_threads(self) -> int:
+        """
+        Intra-op threads for each model call (torch and every ONNX Runtime session): this
+        worker's share of the usable CPUs. It is the whole share, not a per-model split,
+        because the batchers run their models one at a time on a single shared inference
+        thread (see app.models.batching.INFERENCE_EXECUTOR).
+        """
+        if self.INFERENCE_THREADS:
+            return self.INFERENCE_THREADS
+        # The affinity mask reflects CPU_AFFINITY and container cpusets; cpu_count() does not
+        usable = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+        return max(1, (usable or 1) // self.UVICORN_WORKERS)
+
     class Config:
         env_file = ".env"
         case_sensitive = True
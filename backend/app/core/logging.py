@@ -1,16 +1,37 @@
 """
 HIPAA Audit Logger — §164.312(b)
 Logs all API access with timestamp, user, action, IP, and status.
+
+Entries are serialized on the request path but written off it: `log_audit_event`
+appends to an in-process queue that `flush_audit_loop` drains every 100 ms, and an
+atexit hook drains whatever is left when the worker exits. Entries are never dropped:
+if the queue backs up, the request that fills it flushes inline.
 """
 
+import asyncio
+import atexit
 import logging
-import json
+from collections import deque
 from datetime import datetime
 
+import orjson
+
+AUDIT_LOGGER_NAME = "mediscan.audit"
+AUDIT_FLUSH_THRESHOLD = 8192  # queued entries at which log_audit_event flushes inline
+AUDIT_FLUSH_INTERVAL_S = 0.1
+
+logger = logging.getLogger(__name__)
+
+# Pre-serialized entries; deque append / popleft are atomic, so no lock is needed.
+# Unbounded: a HIPAA audit trail must not evict entries when the flusher falls behind.
+AUDIT_QUEUE: deque = deque()
+
 
 def setup_audit_logger():
-    audit_logger = logging.getLogger("mediscan.audit")
+    audit_logger = logging.getLogger(AUDIT_LOGGER_NAME)
     audit_logger.setLevel(logging.INFO)
+    if audit_logger.handlers:
+        return  # already set up (tests, reloads) — a second handler would duplicate every entry
     handler = logging.StreamHandler()
     handler.setFormatter(logging.Formatter("%(message)s"))
     audit_logger.addHandler(handler)
@@ -24,10 +45,9 @@ def log_audit_event(
     status_code: int,
     scan_id: str = None,
 ):
-    """Write a structured HIPAA audit log entry."""
-    audit_logger = logging.getLogger("mediscan.audit")
+    """Queue a structured HIPAA audit log entry for the next flush."""
     entry = {
-        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "timestamp": datetime.utcnow(),
         "user_id": user_id,
         "action": action,
         "endpoint": endpoint,
@@ -36,4 +56,34 @@ def log_audit_event(
         "scan_id": scan_id,
         "hipaa_ref": "§164.312(b)",
     }
-    audit_logger.info(json.dumps(entry))
+    AUDIT_QUEUE.append(orjson.dumps(entry, option=orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z))
+    if len(AUDIT_QUEUE) >= AUDIT_FLUSH_THRESHOLD:
+        # The background flush has fallen behind (or died) — apply backpressure instead
+        flush_audit_queue()
+
+
+def flush_audit_queue():
+    """Write all queued entries as a single log record (one line per entry)."""
+    entries = []
+    while True:
+        try:
+            entries.append(AUDIT_QUEUE.popleft())
+        except IndexError:
+            break
+    if entries:
+        logging.getLogger(AUDIT_LOGGER_NAME).info(b"\n".join(entries).decode())
+
+
+# Registered once per process, however many times setup_audit_logger() runs
+atexit.register(flush_audit_queue)
+
+
+async def flush_audit_loop():
+    """Background task (started from the app lifespan) that drains the audit queue."""
+    while True:
+        await asyncio.sleep(AUDIT_FLUSH_INTERVAL_S)
+        try:
+            flush_audit_queue()
+        except Exception:
+            # Keep the task alive; a failing handler must not stop every later flush
+            logger.exception("❌ Failed to flush audit log queue")
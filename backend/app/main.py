@@ -17,9 +17,11 @@ It is not a certified medical device and must not be used for clinical diagnosis
 
 from contextlib import asynccontextmanager
 from typing import Dict, Any
+import asyncio
+import contextlib
 import logging
+import secrets
 import time
-import uuid
 
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
@@ -28,7 +30,10 @@ from fastapi.responses import JSONResponse
 
 from app.api.v1 import analyze, auth, reports
 from app.core.config import settings
-from app.core.logging import setup_audit_logger
+from app.core.logging import flush_audit_loop, flush_audit_queue, setup_audit_logger
+from app.models.biogpt import get_report_batcher, get_report_generator
+from app.models.densenet import get_grad_cam_batcher, get_vision_batcher, get_vision_model
+from app.services.storage import get_storage_service
 
 # -----------------------------------------------------------------------------
 # Constants
@@ -37,12 +42,30 @@ APP_NAME = "MediScan AI"
 APP_VERSION = "1.0.0"
 API_PREFIX = "/api/v1"
 
+# Uptime / readiness probes — hit constantly and not worth tracing
+_SKIP_PATHS = frozenset({f"{API_PREFIX}/health", f"{API_PREFIX}/ready"})
+
 # -----------------------------------------------------------------------------
 # Logging
 # -----------------------------------------------------------------------------
 logger = logging.getLogger(__name__)
 
 
+# -----------------------------------------------------------------------------
+# Model Warmup
+# -----------------------------------------------------------------------------
+def warm_up_models() -> None:
+    """
+    Load the model singletons before the first real request instead of inside it. The
+    vision model warms up every inference path in its constructor; BioGPT gets one dummy
+    report here so ORT graph initialisation and allocator warmup happen at startup too.
+    """
+    get_vision_model()
+    get_report_generator().generate_report(
+        [{"name": "Pneumonia", "confidence": 0.5}], "MODERATE"
+    )
+
+
 # -----------------------------------------------------------------------------
 # Lifespan (Startup / Shutdown)
 # -----------------------------------------------------------------------------
@@ -52,10 +75,16 @@ async def lifespan(app: FastAPI):
     Manages application lifecycle events.
 
     Startup:
-    - Initializes audit logging
+    - Initializes audit logging and starts the audit flush task
+    - Loads and warms up the vision + NLP models
+    - Opens the pooled Azure Blob client
+    - Starts the inference batchers
     - Logs application boot status
 
     Shutdown:
+    - Stops the inference batchers
+    - Closes the Azure Blob client and its connection pool
+    - Stops the audit flush task and drains the audit queue
     - Logs graceful shutdown message
     """
     logger.info("🩻 %s starting up (v%s)...", APP_NAME, APP_VERSION)
@@ -66,9 +95,36 @@ async def lifespan(app: FastAPI):
     except Exception as exc:
         logger.exception("❌ Failed to initialize audit logger: %s", exc)
         # Continue startup for MVP resilience; production may fail-fast instead.
+    audit_flush_task = asyncio.create_task(flush_audit_loop())
+
+    if settings.WARMUP_MODELS:
+        try:
+            await asyncio.to_thread(warm_up_models)
+            logger.info("✅ Models loaded and warmed up.")
+        except Exception as exc:
+            logger.exception("❌ Model warmup failed: %s", exc)
+
+    # One pooled async Blob client for the process lifetime, shared by every request
+    storage = get_storage_service()
+    try:
+        await storage.start()
+    except Exception as exc:
+        logger.exception("❌ Failed to connect to Azure Blob Storage: %s", exc)
+    app.state.blob_client = storage.client
+
+    batchers = [get_vision_batcher(), get_grad_cam_batcher(), get_report_batcher()]
+    for batcher in batchers:
+        batcher.start()
 
     yield
 
+    for batcher in batchers:
+        await batcher.stop()
+    await storage.close()
+    audit_flush_task.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await audit_flush_task
+    flush_audit_queue()
     logger.info("🛑 %s shutting down.", APP_NAME)
 
 
@@ -130,9 +186,14 @@ async def request_context_middleware(request: Request, call_next):
     Headers added:
     - X-Request-ID
     - X-Process-Time
+
+    Health / readiness probes pass straight through.
     """
-    request_id = str(uuid.uuid4())
-    start_time = time.time()
+    if request.url.path in _SKIP_PATHS:
+        return await call_next(request)
+
+    request_id = secrets.token_hex(8)
+    start_ns = time.perf_counter_ns()
 
     # Store request ID in request state for downstream handlers if needed
     request.state.request_id = request_id
@@ -155,7 +216,7 @@ async def request_context_middleware(request: Request, call_next):
             },
         )
 
-    process_time = time.time() - start_time
+    process_time = (time.perf_counter_ns() - start_ns) / 1e9
 
     response.headers["X-Request-ID"] = request_id
     response.headers["X-Process-Time"] = f"{process_time:.4f}"
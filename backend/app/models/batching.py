@@ -0,0 +1,112 @@
+"""
+Dynamic request batching
+Coalesces concurrent inference calls into a single batched model invocation
+"""
+
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# One thread runs every batcher's batch_fn (DenseNet, Grad-CAM, BioGPT). Each model call
+# already fans out over settings.inference_threads intra-op threads — the worker's whole
+# CPU share — so running the models one at a time uses the cores fully, where three
+# concurrent calls would each claim that share and oversubscribe the CPU three times over.
+INFERENCE_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+
+
+class DynamicBatcher:
+    """
+    Collects items submitted by concurrent requests and hands them to `batch_fn`
+    together — up to `max_batch_size` items, waiting at most `max_wait_ms` after
+    the first one arrives. `batch_fn` runs on the shared inference thread so the event
+    loop keeps accepting requests while the model is busy.
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[Any]], List[Any]],
+        name: str,
+        max_batch_size: int = settings.BATCH_MAX_SIZE,
+        max_wait_ms: int = settings.BATCH_MAX_WAIT_MS,
+    ):
+        self.batch_fn = batch_fn
+        self.name = name
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start the batching loop on the running event loop (no-op if already running)."""
+        loop = asyncio.get_running_loop()
+        if self._task is not None and not self._task.done() and self._task.get_loop() is loop:
+            return
+        self._queue = asyncio.Queue()
+        self._task = loop.create_task(self._run())
+        logger.info(
+            f"Batcher '{self.name}' started (max_batch={self.max_batch_size}, "
+            f"max_wait={self.max_wait_ms}ms)"
+        )
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def submit(self, item: Any) -> Any:
+        """Queue one item and wait for its slice of the batched result."""
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _collect(self) -> List[Tuple[Any, asyncio.Future]]:
+        loop = asyncio.get_running_loop()
+        pending = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait_ms / 1000
+        while len(pending) < self.max_batch_size:
+            # Requests that queued up while the previous batch ran are taken without waiting
+            if not self._queue.empty():
+                pending.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                pending.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return pending
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            pending = await self._collect()
+            items = [item for item, _ in pending]
+            try:
+                results = await loop.run_in_executor(INFERENCE_EXECUTOR, self.batch_fn, items)
+                if len(results) != len(items):
+                    # Results can no longer be matched to requests; never leave a caller waiting
+                    raise RuntimeError(
+                        f"batch_fn returned {len(results)} results for {len(items)} items"
+                    )
+            except Exception as e:
+                logger.error(f"Batcher '{self.name}' failed on batch of {len(items)}: {e}")
+                for _, future in pending:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), result in zip(pending, results):
+                if not future.done():
+                    future.set_result(result)
@@ -3,17 +3,45 @@ BioGPT NLP Report Generator
 Uses Microsoft BioGPT via HuggingFace to generate structured radiology reports
 """
 
-from transformers import pipeline, BioGptTokenizer, BioGptForCausalLM
-from typing import Dict, List
+import torch
+from transformers import BioGptTokenizer, BioGptForCausalLM
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, List, Optional
 import logging
+import os
+import tempfile
+import threading
+
+from app.core.config import settings
+from app.models.batching import DynamicBatcher
+from app.models.cache import model_cache_dir
 
 logger = logging.getLogger(__name__)
 
+try:
+    import onnxruntime as ort
+    from optimum.onnxruntime import ORTModelForCausalLM, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    OPTIMUM_AVAILABLE = True
+except ImportError:
+    OPTIMUM_AVAILABLE = False
+    logger.warning("optimum[onnxruntime] not installed. Using eager PyTorch BioGPT.")
+
+# Findings keep only the first 3 sentences, which fit comfortably in 60 tokens
+MAX_NEW_TOKENS = 60
+
+# Generated findings are memoised by prompt; repeat condition sets skip BioGPT entirely
+FINDINGS_CACHE_SIZE = 1024
+
+DEFAULT_SCAN_TYPE = "chest X-ray"
+
 REPORT_DISCLAIMER = (
     "\n\n⚠️ DISCLAIMER: This AI-generated report is for educational and research "
     "purposes only and does not constitute medical advice or a clinical diagnosis. "
     "Always consult a qualified radiologist or physician."
 )
+_DISCLAIMER_TEXT = REPORT_DISCLAIMER.strip()
 
 SEVERITY_RECOMMENDATIONS = {
     "URGENT": "URGENT: Immediate clinical review required. Please escalate to attending physician.",
@@ -22,6 +50,24 @@ SEVERITY_RECOMMENDATIONS = {
     "MILD": "Findings noted. Routine follow-up recommended at next scheduled visit.",
     "NORMAL": "No acute cardiopulmonary findings. Routine follow-up as clinically indicated.",
 }
+_DEFAULT_RECOMMENDATION = SEVERITY_RECOMMENDATIONS["NORMAL"]
+
+NORMAL_FINDINGS = "No acute cardiopulmonary findings identified. Lung fields appear clear bilaterally."
+NORMAL_IMPRESSION = "Normal chest radiograph. No acute disease identified."
+
+
+def _technique(scan_type: str) -> str:
+    return f"PA {scan_type}. AI-assisted analysis performed using DenseNet-121 with CheXpert pretrained weights."
+
+
+# Report for a NORMAL chest X-ray with no significant conditions — fully deterministic
+NORMAL_REPORT = {
+    "technique": _technique(DEFAULT_SCAN_TYPE),
+    "findings": NORMAL_FINDINGS,
+    "impression": NORMAL_IMPRESSION,
+    "recommendation": _DEFAULT_RECOMMENDATION,
+    "disclaimer": _DISCLAIMER_TEXT,
+}
 
 
 class BioGPTReportGenerator:
@@ -30,20 +76,97 @@ class BioGPTReportGenerator:
     def __init__(self, model_name: str = "microsoft/biogpt"):
         logger.info(f"Loading BioGPT model: {model_name}")
         self.tokenizer = BioGptTokenizer.from_pretrained(model_name)
-        self.model = BioGptForCausalLM.from_pretrained(model_name)
-        self.generator = pipeline(
-            "text-generation",
-            model=self.model,
-            tokenizer=self.tokenizer,
-            max_new_tokens=200,
-        )
+        self._findings_cache: "OrderedDict[str, str]" = OrderedDict()
+        # Left-pad so every prompt in a batch ends where generation starts
+        self.tokenizer.padding_side = "left"
+        if settings.REPORT_BACKEND == "onnx" and OPTIMUM_AVAILABLE:
+            self.model = self._load_onnx_int8(model_name)
+        else:
+            self.model = BioGptForCausalLM.from_pretrained(model_name)
+            self.model.eval()
         logger.info("✅ BioGPT model loaded successfully")
 
+    def _load_onnx_int8(self, model_name: str) -> "ORTModelForCausalLM":
+        """Export BioGPT to ONNX (with past-KV inputs) and dynamically quantize weights to INT8."""
+        cache_dir = model_cache_dir()
+        quantized_dir = os.path.join(cache_dir, "biogpt-onnx-int8")
+
+        if not os.path.isdir(quantized_dir):
+            # Built in a private scratch directory and renamed into place only once complete,
+            # so concurrent workers and interrupted builds never leave a partial quantized_dir
+            with tempfile.TemporaryDirectory(dir=cache_dir) as work_dir:
+                export_dir = os.path.join(work_dir, "biogpt-onnx")
+                build_dir = os.path.join(work_dir, "biogpt-onnx-int8")
+
+                logger.info("Exporting BioGPT to ONNX")
+                ort_model = ORTModelForCausalLM.from_pretrained(model_name, export=True, use_cache=True)
+                ort_model.save_pretrained(export_dir)
+
+                logger.info(f"Quantizing BioGPT to INT8: {quantized_dir}")
+                quantizer = ORTQuantizer.from_pretrained(export_dir)
+                quantizer.quantize(
+                    save_dir=build_dir,
+                    quantization_config=AutoQuantizationConfig.avx512_vnni(
+                        is_static=False, per_channel=True
+                    ),
+                )
+                ort_model.config.save_pretrained(build_dir)
+
+                try:
+                    os.rename(build_dir, quantized_dir)
+                except OSError:
+                    # Another worker renamed its complete build into place first
+                    if not os.path.isdir(quantized_dir):
+                        raise
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = settings.inference_threads
+        return ORTModelForCausalLM.from_pretrained(
+            quantized_dir,
+            file_name="model_quantized.onnx",
+            use_cache=True,
+            session_options=options,
+        )
+
+    @torch.no_grad()
+    def _greedy_generate(self, prompts: List[str]) -> List[str]:
+        """Greedy decoding that feeds only the newest token each step, reusing past key/values."""
+        inputs = self.tokenizer(prompts, return_tensors="pt", padding=True)
+        input_ids = inputs["input_ids"]
+        attention_mask = inputs["attention_mask"]
+        batch_size = input_ids.shape[0]
+
+        past_key_values = None
+        finished = torch.zeros(batch_size, dtype=torch.bool)
+        new_tokens = []
+        for _ in range(MAX_NEW_TOKENS):
+            outputs = self.model(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                past_key_values=past_key_values,
+                use_cache=True,
+            )
+            past_key_values = outputs.past_key_values
+
+            next_tokens = outputs.logits[:, -1, :].argmax(dim=-1)
+            next_tokens = next_tokens.masked_fill(finished, self.tokenizer.pad_token_id)
+            new_tokens.append(next_tokens)
+            finished |= next_tokens == self.tokenizer.eos_token_id
+            if finished.all():
+                break
+
+            input_ids = next_tokens[:, None]
+            attention_mask = torch.cat(
+                [attention_mask, attention_mask.new_ones((batch_size, 1))], dim=1
+            )
+
+        return self.tokenizer.batch_decode(torch.stack(new_tokens, dim=1), skip_special_tokens=True)
+
     def generate_report(
         self,
         conditions: List[Dict],
         severity: str,
-        scan_type: str = "chest X-ray",
+        scan_type: str = DEFAULT_SCAN_TYPE,
     ) -> Dict[str, str]:
         """
         Generate a structured radiology report.
@@ -51,28 +174,82 @@ class BioGPTReportGenerator:
         Returns a dict with sections:
           - technique, findings, impression, recommendation
         """
-        significant = [c for c in conditions if c["confidence"] > 0.30]
-        normal = len(significant) == 0
+        return self.generate_reports([
+            {"conditions": conditions, "severity": severity, "scan_type": scan_type}
+        ])[0]
 
-        technique = f"PA {scan_type}. AI-assisted analysis performed using DenseNet-121 with CheXpert pretrained weights."
+    def generate_reports(self, requests: List[Dict]) -> List[Dict[str, str]]:
+        """
+        Batched `generate_report`: each request holds `conditions`, `severity` and
+        optionally `scan_type`. All abnormal scans share a single BioGPT call.
+        """
+        significant = [
+            [c for c in request["conditions"] if c["confidence"] > 0.30]
+            for request in requests
+        ]
 
-        if normal:
-            findings_text = "No acute cardiopulmonary findings identified. Lung fields appear clear bilaterally."
-            impression_text = "Normal chest radiograph. No acute disease identified."
-        else:
-            # Build BioGPT prompt from detected conditions
-            condition_list = ", ".join(
-                [f"{c['name']} ({c['confidence']:.0%})" for c in significant[:5]]
-            )
-            prompt = (
-                f"Radiology report findings for a patient with {condition_list}: "
-                f"The chest radiograph demonstrates"
-            )
-            generated = self.generator(prompt, do_sample=False)[0]["generated_text"]
-            # Strip the prompt from output
-            findings_text = generated[len(prompt):].strip().split(".")[0:3]
-            findings_text = ". ".join(findings_text).strip() + "."
+        prompts = {i: self._build_prompt(sig) for i, sig in enumerate(significant) if sig}
+        findings = {i: self._cached_findings(prompt) for i, prompt in prompts.items()}
+
+        # Generate once per distinct uncached prompt
+        missing = list(dict.fromkeys(prompts[i] for i, text in findings.items() if text is None))
+        if missing:
+            generated = {
+                prompt: self._extract_findings(continuation)
+                for prompt, continuation in zip(missing, self._greedy_generate(missing))
+            }
+            for prompt, findings_text in generated.items():
+                self._cache_findings(prompt, findings_text)
+            findings = {
+                i: text if text is not None else generated[prompts[i]]
+                for i, text in findings.items()
+            }
+
+        return [
+            self._build_sections(request, significant[i], findings.get(i))
+            for i, request in enumerate(requests)
+        ]
 
+    @staticmethod
+    def _build_prompt(significant: List[Dict]) -> str:
+        """Build BioGPT prompt from detected conditions."""
+        condition_list = ", ".join(
+            [f"{c['name']} ({c['confidence']:.0%})" for c in significant[:5]]
+        )
+        return (
+            f"Radiology report findings for a patient with {condition_list}: "
+            f"The chest radiograph demonstrates"
+        )
+
+    def _cached_findings(self, prompt: str) -> Optional[str]:
+        findings_text = self._findings_cache.get(prompt)
+        if findings_text is not None:
+            self._findings_cache.move_to_end(prompt)
+        return findings_text
+
+    def _cache_findings(self, prompt: str, findings_text: str):
+        self._findings_cache[prompt] = findings_text
+        if len(self._findings_cache) > FINDINGS_CACHE_SIZE:
+            self._findings_cache.popitem(last=False)
+
+    @staticmethod
+    def _extract_findings(continuation: str) -> str:
+        findings_text = continuation.strip().split(".")[0:3]
+        return ". ".join(findings_text).strip() + "."
+
+    @staticmethod
+    def _build_sections(
+        request: Dict, significant: List[Dict], findings_text: str
+    ) -> Dict[str, str]:
+        severity = request["severity"]
+        scan_type = request.get("scan_type", DEFAULT_SCAN_TYPE)
+
+        if not significant:
+            if severity == "NORMAL" and scan_type == DEFAULT_SCAN_TYPE:
+                return NORMAL_REPORT
+            findings_text = NORMAL_FINDINGS
+            impression_text = NORMAL_IMPRESSION
+        else:
             top = significant[0]
             impression_text = (
                 f"Findings most consistent with {top['name']} "
@@ -80,23 +257,35 @@ class BioGPTReportGenerator:
                 f"Severity classification: {severity}."
             )
 
-        recommendation = SEVERITY_RECOMMENDATIONS.get(severity, SEVERITY_RECOMMENDATIONS["NORMAL"])
+        recommendation = SEVERITY_RECOMMENDATIONS.get(severity, _DEFAULT_RECOMMENDATION)
 
         return {
-            "technique": technique,
+            "technique": _technique(scan_type),
             "findings": findings_text,
             "impression": impression_text,
             "recommendation": recommendation,
-            "disclaimer": REPORT_DISCLAIMER.strip(),
+            "disclaimer": _DISCLAIMER_TEXT,
         }
 
 
-# Singleton
+# Singleton — construction is locked because batcher worker threads may race to it
 _generator_instance = None
+_generator_lock = threading.Lock()
 
 
 def get_report_generator() -> BioGPTReportGenerator:
     global _generator_instance
     if _generator_instance is None:
-        _generator_instance = BioGPTReportGenerator()
+        with _generator_lock:
+            if _generator_instance is None:
+                _generator_instance = BioGPTReportGenerator()
     return _generator_instance
+
+
+@lru_cache(maxsize=1)
+def get_report_batcher() -> DynamicBatcher:
+    """Batcher coalescing concurrent report requests into one BioGPT generation call."""
+    return DynamicBatcher(
+        lambda requests: get_report_generator().generate_reports(requests),
+        name="biogpt",
+    )
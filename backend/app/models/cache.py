@@ -0,0 +1,29 @@
+"""
+On-disk model cache (checkpoints, exported / quantized ONNX graphs, TensorRT engines)
+Everything in it is loaded into the API worker, so only the app user may write to it.
+"""
+
+import os
+import stat
+
+from app.core.config import settings
+
+
+def model_cache_dir() -> str:
+    """
+    Create MODEL_CACHE_DIR (mode 0700) if needed and return it, refusing a directory that
+    belongs to another user or that group / other can write to. `makedirs(mode=...)` does
+    not touch a directory that already exists, so a pre-created one has to be checked.
+    """
+    path = settings.MODEL_CACHE_DIR
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.stat(path)
+    if hasattr(os, "getuid") and info.st_uid != os.getuid():
+        raise PermissionError(
+            f"MODEL_CACHE_DIR {path} is owned by uid {info.st_uid}, not the app user ({os.getuid()})"
+        )
+    if info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise PermissionError(
+            f"MODEL_CACHE_DIR {path} is group- or world-writable (mode {stat.filemode(info.st_mode)})"
+        )
+    return path
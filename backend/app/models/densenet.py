@@ -5,17 +5,36 @@ Uses torchxrayvision pretrained weights on CheXpert (no training required)
 
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 import numpy as np
 import torchxrayvision as xrv
-import torchvision.transforms as transforms
 from PIL import Image
 import cv2
 import io
+import os
 import logging
-from typing import Dict, List, Tuple
+import tempfile
+import threading
+from bisect import bisect_right
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.models.batching import DynamicBatcher
+from app.models.cache import model_cache_dir
 
 logger = logging.getLogger(__name__)
 
+try:
+    import onnxruntime as ort
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+    ONNX_AVAILABLE = True
+except ImportError:
+    ONNX_AVAILABLE = False
+    logger.warning("onnxruntime not installed. Using eager PyTorch inference.")
+
 # 14 pathological conditions (CheXpert label set)
 PATHOLOGY_LABELS = [
     "Atelectasis", "Cardiomegaly", "Consolidation", "Edema",
@@ -32,8 +51,116 @@ SEVERITY_THRESHOLDS = {
     "NORMAL": 0.0,
 }
 
+# Ascending severity levels and the lower bounds of all but the first, for bisection
+_SEVERITY_LEVELS = tuple(sorted(SEVERITY_THRESHOLDS, key=SEVERITY_THRESHOLDS.get))
+_SEVERITY_BOUNDS = tuple(SEVERITY_THRESHOLDS[level] for level in _SEVERITY_LEVELS[1:])
+
 # Conditions that trigger URGENT alert regardless of threshold
-URGENT_CONDITIONS = {"Pneumothorax", "Pneumonia", "Cardiomegaly"}
+URGENT_CONDITIONS = frozenset({"Pneumothorax", "Pneumonia", "Cardiomegaly"})
+
+MODEL_INPUT_SIZE = (224, 224)
+
+# xrv.datasets.normalize(img, 255) maps [0, 255] linearly onto [-1024, 1024]
+XRV_SCALE = 2048.0 / 255.0
+XRV_OFFSET = 1024.0
+
+# OpenCV decode modes in which libjpeg-turbo scales the DCT by 1/8, 1/4 or 1/2
+REDUCED_GRAYSCALE_MODES = (
+    (8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+    (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+    (2, cv2.IMREAD_REDUCED_GRAYSCALE_2),
+)
+
+HEATMAP_CONTENT_TYPES = {"png": "image/png", "webp": "image/webp"}
+WEBP_QUALITY = 85
+HEATMAP_ALPHA = 0.4
+
+
+def _build_overlay_lut() -> np.ndarray:
+    """
+    Overlay colour for every (gray, heat) pair of 8-bit values, indexed by `gray << 8 | heat`:
+    the cv2.addWeighted blend of the grayscale pixel (0.6) with JET(heat) (0.4), in BGR.
+    Bit-exact with the GRAY2RGB + applyColorMap + addWeighted chain it replaces.
+    """
+    jet = cv2.applyColorMap(np.arange(256, dtype=np.uint8).reshape(-1, 1), cv2.COLORMAP_JET)[:, 0]
+    gray = np.arange(256, dtype=np.float64)[:, None, None]
+    blend = gray * (1 - HEATMAP_ALPHA) + jet[None].astype(np.float64) * HEATMAP_ALPHA
+    return np.rint(blend).astype(np.uint8).reshape(-1, 3)
+
+
+OVERLAY_LUT_BGR = _build_overlay_lut()  # [65536, 3], in the channel order OpenCV encodes
+
+WARMUP_ITERATIONS = 5
+
+ONNX_INPUT_NAME = "input"
+ONNX_OUTPUT_NAME = "output"
+CALIBRATION_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+@contextmanager
+def _atomic_output(path: str):
+    """
+    Yield a per-process temp path next to `path` and move it into place only once the
+    body has written it completely, so concurrent workers never read a half-written file
+    and an interrupted build leaves nothing behind to be reused.
+    """
+    root, ext = os.path.splitext(path)
+    tmp_path = f"{root}.{os.getpid()}.tmp{ext}"
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _decode_grayscale(image_bytes: bytes) -> np.ndarray:
+    """
+    Decode an upload to a uint8 grayscale array with OpenCV. The header (parsed by PIL
+    without touching pixel data) selects the coarsest reduced decode mode that still
+    covers the 224x224 model input, so large X-rays are never fully decoded.
+    """
+    width, height = Image.open(io.BytesIO(image_bytes)).size
+    mode = cv2.IMREAD_GRAYSCALE
+    for scale, reduced_mode in REDUCED_GRAYSCALE_MODES:
+        if min(width, height) // scale >= MODEL_INPUT_SIZE[0]:
+            mode = reduced_mode
+            break
+
+    img = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), mode)
+    if img is None:
+        raise ValueError("Could not decode image")
+    return img
+
+
+def _normalize_into(images: List[np.ndarray], out: np.ndarray) -> np.ndarray:
+    """Write uint8 [224, 224] images into `out[:n]` as xrv-normalized [n, 1, 224, 224] (in out's dtype)."""
+    batch = out[:len(images)]
+    for i, img in enumerate(images):
+        np.multiply(img, XRV_SCALE, out=batch[i, 0], casting="unsafe")
+    batch -= XRV_OFFSET
+    return batch
+
+
+class ChexCalibrationReader:
+    """Feeds preprocessed CheXpert images to ONNX Runtime static-quantization calibration."""
+
+    def __init__(self, image_paths: List[str], preprocess: Callable[[bytes], np.ndarray]):
+        self.image_paths = image_paths
+        self.preprocess = preprocess
+        self._iter = iter(image_paths)
+
+    def get_next(self) -> Optional[Dict[str, np.ndarray]]:
+        path = next(self._iter, None)
+        if path is None:
+            return None
+        with open(path, "rb") as f:
+            image = self.preprocess(f.read())
+        model_input = np.empty((1, 1, *MODEL_INPUT_SIZE), dtype=np.float32)
+        return {ONNX_INPUT_NAME: _normalize_into([image], model_input)}
+
+    def rewind(self):
+        self._iter = iter(self.image_paths)
 
 
 class GradCAM:
@@ -46,31 +173,69 @@ class GradCAM:
         self._register_hooks()
 
     def _register_hooks(self):
-        def forward_hook(module, input, output):
-            self.activations = output.detach()
+        def save_gradient(grad):
+            self.gradients = grad.detach()
 
-        def backward_hook(module, grad_input, grad_output):
-            self.gradients = grad_output[0].detach()
+        def forward_hook(module, input, output):
+            # Only grad-enabled (Grad-CAM) passes are recorded: inference-mode classification
+            # forwards stay compilable and may run concurrently on another thread. A tensor
+            # hook is used rather than a module backward hook for the same reason.
+            if output.requires_grad:
+                self.activations = output.detach()
+                output.register_hook(save_gradient)
 
         # Hook into the last DenseBlock
         target_layer = self.model.model.features.denseblock4
         target_layer.register_forward_hook(forward_hook)
-        target_layer.register_full_backward_hook(backward_hook)
 
-    def generate(self, image_tensor: torch.Tensor, class_idx: int) -> np.ndarray:
-        """Generate Grad-CAM heatmap for the given class index."""
+    def forward(self, image_batch: torch.Tensor) -> torch.Tensor:
+        """Grad-enabled forward; the hooks keep DenseBlock4 activations for `generate`."""
         self.model.zero_grad()
-        output = self.model(image_tensor)
-        output[0, class_idx].backward()
-
-        weights = self.gradients.mean(dim=[2, 3], keepdim=True)
-        cam = (weights * self.activations).sum(dim=1, keepdim=True)
-        cam = torch.relu(cam).squeeze().cpu().numpy()
-
-        # Normalize and resize to input dimensions
-        cam = (cam - cam.min()) / (cam.max() - cam.min() + 1e-8)
-        cam = cv2.resize(cam, (224, 224))
-        return cam
+        return self.model(image_batch)
+
+    def generate(
+        self, output: torch.Tensor, rows: torch.Tensor, class_indices: torch.Tensor
+    ) -> np.ndarray:
+        """
+        Generate Grad-CAM heatmaps for `rows` of the batch behind `output` (from `forward`),
+        each for its class in `class_indices`, as [n, 224, 224] uint8. Images in a batch are
+        independent (eval mode), so a single backward yields every row's gradients. The
+        reduction, upsampling and normalization stay on the model's device; only the final
+        uint8 maps are copied back.
+        """
+        rows = rows.to(output.device)
+        output[rows, class_indices.to(output.device)].sum().backward()
+
+        # Reduce in FP32 even when the model runs in FP16
+        weights = self.gradients[rows].float().mean(dim=[2, 3], keepdim=True)
+        cams = torch.relu((weights * self.activations[rows].float()).sum(dim=1, keepdim=True))
+        cams = F.interpolate(cams, size=MODEL_INPUT_SIZE, mode="bilinear", align_corners=False)
+        # The hooks hold views of this batch's DenseBlock4 storage — let the allocator have it back
+        self.activations = self.gradients = None
+
+        # Per-image min-max normalization
+        low = cams.amin(dim=(2, 3), keepdim=True)
+        high = cams.amax(dim=(2, 3), keepdim=True)
+        cams = (cams - low) / (high - low + 1e-8)
+        return (cams * 255).to(torch.uint8).squeeze(1).cpu().numpy()
+
+
+def _densenet_skeleton(model_name: str) -> nn.Module:
+    """
+    xrv DenseNet for `model_name` with parameters on the meta device (no memory allocated)
+    and the metadata xrv's constructor would set when it loads the weights itself.
+    """
+    info = xrv.models.model_urls[model_name]
+    num_classes = len(info["labels"])
+    with torch.device("meta"):
+        model = xrv.models.DenseNet(
+            num_classes=num_classes,
+            op_threshs=torch.empty(num_classes) if "op_threshs" in info else None,
+        )
+    model.weights = model_name
+    model.targets = model.pathologies = info["labels"]
+    model.upsample = nn.Upsample(size=MODEL_INPUT_SIZE, mode="bilinear", align_corners=False)
+    return model
 
 
 class MediScanVisionModel:
@@ -78,92 +243,408 @@ class MediScanVisionModel:
 
     def __init__(self, model_name: str = "densenet121-res224-chex"):
         logger.info(f"Loading torchxrayvision model: {model_name}")
-        self.model = xrv.models.DenseNet(weights=model_name)
+        torch.set_num_threads(settings.inference_threads)
+        self.model = self._load_model(model_name)
         self.model.eval()
+
+        # Model outputs reported as conditions, in model output order
+        self._pathology_mask = np.array([label in PATHOLOGY_LABELS for label in self.model.pathologies])
+        self._pathology_names = np.array(self.model.pathologies)[self._pathology_mask]
+
+        self.device = torch.device("cpu")
+        if settings.USE_GPU:
+            if torch.cuda.is_available():
+                self.device = torch.device("cuda")
+            else:
+                logger.warning("⚠️  USE_GPU is set but CUDA is unavailable — running on CPU")
+        # FP16 + NHWC lets cuDNN pick Tensor Core convolutions. The CPU path stays FP32 and
+        # NCHW: converting the weights would copy them out of the shared mmap'd checkpoint.
+        on_gpu = self.device.type == "cuda"
+        if on_gpu:
+            # TF32 for anything left in FP32 (Grad-CAM reductions); autotune conv algorithms
+            # per input shape — the batcher only produces BATCH_MAX_SIZE distinct shapes
+            torch.set_float32_matmul_precision("high")
+            torch.backends.cuda.matmul.allow_tf32 = True
+            torch.backends.cudnn.allow_tf32 = True
+            torch.backends.cudnn.benchmark = True
+        self.dtype = torch.float16 if on_gpu else torch.float32
+        self.memory_format = torch.channels_last if on_gpu else torch.contiguous_format
+
+        # ONNX Runtime session for classification; the eager model is kept for Grad-CAM
+        self.session = None
+        if settings.VISION_BACKEND == "onnx" and ONNX_AVAILABLE:
+            self.session = self._build_onnx_session(model_name)
+
+        # Normalized model inputs are written in place here; the batcher runs one batch at a time
+        input_shape = (settings.BATCH_MAX_SIZE, 1, *MODEL_INPUT_SIZE)
+        self._device_buf = None
+        if on_gpu and self.session is None:
+            # Page-locked host buffer in the device buffer's dtype and layout, so the H2D copy
+            # on the side stream is a straight async DMA (no conversion) into a device buffer
+            # that is reused for every batch. Normalization writes FP16 directly on GPU.
+            self._input_buf = torch.empty(
+                input_shape, dtype=self.dtype, memory_format=self.memory_format, pin_memory=True
+            ).numpy()
+            self._device_buf = torch.empty(
+                input_shape, device=self.device, dtype=self.dtype, memory_format=self.memory_format
+            )
+            self._copy_stream = torch.cuda.Stream(self.device)
+        else:
+            # ONNX Runtime binds this buffer directly and takes the FP32 graph input
+            self._input_buf = np.empty(input_shape, dtype=np.float32)
+
+        # Exported from the FP32 CPU model above; only the PyTorch path moves to the GPU
+        self.model.to(self.device, dtype=self.dtype, memory_format=self.memory_format)
+
+        # Hooks are registered after export so they are not traced into the ONNX graph
         self.grad_cam = GradCAM(self.model)
-        self.transform = transforms.Compose([
-            xrv.datasets.XRayCenterCrop(),
-            xrv.datasets.XRayResizer(224),
-        ])
-        logger.info("✅ Vision model loaded successfully")
-
-    def preprocess(self, image_bytes: bytes) -> torch.Tensor:
-        """Convert uploaded image bytes to model-ready tensor."""
-        img = Image.open(io.BytesIO(image_bytes)).convert("L")  # grayscale
-        img_array = np.array(img)
-        img_array = xrv.datasets.normalize(img_array, 255)
-        img_array = img_array[None, ...]  # add channel dim
-        img_tensor = torch.from_numpy(self.transform(img_array)).unsqueeze(0)
-        return img_tensor
+
+        # Compiled inference-mode forward for classification; Grad-CAM keeps the eager model
+        self.classifier = None
+        if self.session is None and settings.TORCH_COMPILE:
+            logger.info(f"Compiling DenseNet with torch.compile ({settings.TORCH_COMPILE_BACKEND})")
+            compile_kwargs = {}
+            if on_gpu and settings.TORCH_COMPILE_BACKEND == "inductor":
+                compile_kwargs["mode"] = "reduce-overhead"  # CUDA graphs
+            self.classifier = torch.compile(
+                self.model,
+                backend=settings.TORCH_COMPILE_BACKEND,
+                fullgraph=False,
+                dynamic=False,
+                **compile_kwargs,
+            )
+            self._compile_batch_sizes()
+        # Only the eager model can reuse its classification forward for Grad-CAM
+        self.fused_grad_cam = self.session is None and self.classifier is None
+        if settings.WARMUP_MODELS:
+            self._warm_up()
+        logger.info(f"✅ Vision model loaded successfully ({self.device}, {self.dtype})")
+
+    def _warm_up(self):
+        """
+        Push dummy batches through classification (smallest and largest batch) and one
+        Grad-CAM forward + backward, so CUDA context init, cuDNN autotuning, oneDNN primitive
+        creation and allocator growth happen at startup instead of in the first requests.
+        """
+        blank = np.zeros(MODEL_INPUT_SIZE, dtype=np.uint8)
+        for batch_size in sorted({1, settings.BATCH_MAX_SIZE}):
+            for _ in range(WARMUP_ITERATIONS):
+                self.predict_batch([blank] * batch_size)
+        self.explain_batch([(blank, 0)])
+        if self.device.type == "cuda":
+            torch.cuda.synchronize(self.device)
+
+    def _load_model(self, model_name: str) -> nn.Module:
+        """
+        Load DenseNet weights from a cached state-dict checkpoint memory-mapped from disk, so
+        weight pages are shared through the page cache by every worker rather than copied
+        into each. The first load builds it through torchxrayvision and writes the checkpoint.
+        """
+        path = os.path.join(model_cache_dir(), f"{model_name}.pt")
+        if os.path.exists(path):
+            logger.info(f"Memory-mapping cached DenseNet checkpoint: {path}")
+            model = _densenet_skeleton(model_name)
+            # Tensors only (no pickled code), adopted as-is instead of copied into the skeleton
+            state_dict = torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+            model.load_state_dict(state_dict, assign=True)
+            return model
+
+        model = xrv.models.DenseNet(weights=model_name)
+        with _atomic_output(path) as tmp_path:
+            torch.save(model.state_dict(), tmp_path)
+        return model
+
+    def _compile_batch_sizes(self):
+        """
+        Compile (and on GPU, capture CUDA graphs) for every batch size the batcher can produce,
+        so graph compilation happens at startup rather than inside the first requests.
+        """
+        torch._dynamo.config.cache_size_limit = max(
+            torch._dynamo.config.cache_size_limit, settings.BATCH_MAX_SIZE
+        )
+        with torch.inference_mode():
+            for batch_size in range(1, settings.BATCH_MAX_SIZE + 1):
+                dummy = torch.zeros(batch_size, 1, *MODEL_INPUT_SIZE)
+                self.classifier(self._to_device(dummy))
+        logger.info(f"Compiled DenseNet for batch sizes 1–{settings.BATCH_MAX_SIZE}")
+
+    def _build_onnx_session(self, model_name: str) -> "ort.InferenceSession":
+        """Export DenseNet to ONNX once, quantize it to INT8 if possible, and open a session."""
+        cache_dir = model_cache_dir()
+        fp32_path = os.path.join(cache_dir, f"{model_name}.onnx")
+        int8_path = os.path.join(cache_dir, f"{model_name}.int8.onnx")
+
+        if not os.path.exists(fp32_path):
+            self._export_onnx(fp32_path)
+
+        providers = self._onnx_providers()
+        model_path = fp32_path
+        # The INT8 graph targets CPU kernels; GPU providers take the FP32 graph (TensorRT runs it in FP16)
+        if settings.VISION_INT8 and providers == ["CPUExecutionProvider"] and (
+            os.path.exists(int8_path) or self._quantize_int8(model_name, fp32_path, int8_path)
+        ):
+            model_path = int8_path
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = settings.inference_threads
+        logger.info(f"Loading ONNX Runtime session: {model_path}")
+        return ort.InferenceSession(model_path, sess_options=options, providers=providers)
+
+    def _onnx_providers(self) -> List:
+        """TensorRT (FP16, cached engines) then CUDA on GPU deployments, always falling back to CPU."""
+        if self.device.type != "cuda":
+            return ["CPUExecutionProvider"]
+
+        available = ort.get_available_providers()
+        providers = []
+        if "TensorrtExecutionProvider" in available:
+            shape = f"{ONNX_INPUT_NAME}:{{}}x1x{MODEL_INPUT_SIZE[0]}x{MODEL_INPUT_SIZE[1]}"
+            providers.append(("TensorrtExecutionProvider", {
+                "device_id": self.device.index or 0,
+                "trt_fp16_enable": True,
+                "trt_engine_cache_enable": True,
+                "trt_engine_cache_path": settings.MODEL_CACHE_DIR,
+                # One engine covering every batch size the batcher can produce
+                "trt_profile_min_shapes": shape.format(1),
+                "trt_profile_opt_shapes": shape.format(settings.BATCH_MAX_SIZE),
+                "trt_profile_max_shapes": shape.format(settings.BATCH_MAX_SIZE),
+            }))
+        if "CUDAExecutionProvider" in available:
+            providers.append(("CUDAExecutionProvider", {"device_id": self.device.index or 0}))
+        if not providers:
+            logger.warning("⚠️  onnxruntime has no GPU providers (install onnxruntime-gpu) — using CPU")
+        providers.append("CPUExecutionProvider")
+        return providers
+
+    def _export_onnx(self, path: str):
+        logger.info(f"Exporting DenseNet to ONNX: {path}")
+        dummy = torch.zeros(1, 1, 224, 224)
+        with _atomic_output(path) as tmp_path:
+            torch.onnx.export(
+                self.model,
+                dummy,
+                tmp_path,
+                opset_version=17,
+                input_names=[ONNX_INPUT_NAME],
+                output_names=[ONNX_OUTPUT_NAME],
+                dynamic_axes={ONNX_INPUT_NAME: {0: "B"}, ONNX_OUTPUT_NAME: {0: "B"}},
+            )
+
+    def _quantize_int8(self, model_name: str, fp32_path: str, int8_path: str) -> bool:
+        """Static INT8 quantization calibrated on CheXpert images. Returns False if skipped."""
+        image_dir = settings.CALIBRATION_IMAGE_DIR
+        if not image_dir or not os.path.isdir(image_dir):
+            logger.warning("⚠️  No calibration images configured — serving FP32 ONNX graph")
+            return False
+
+        image_paths = sorted(
+            os.path.join(image_dir, name)
+            for name in os.listdir(image_dir)
+            if name.lower().endswith(CALIBRATION_EXTENSIONS)
+        )[: settings.CALIBRATION_MAX_IMAGES]
+        if not image_paths:
+            logger.warning(f"⚠️  No calibration images found in {image_dir} — serving FP32 ONNX graph")
+            return False
+
+        # The pre-processed graph is only an input to quantization: build it in a private
+        # scratch directory that is removed afterwards
+        with tempfile.TemporaryDirectory(dir=settings.MODEL_CACHE_DIR) as work_dir, \
+                _atomic_output(int8_path) as tmp_int8_path:
+            # Shape inference + graph optimisation (folds BatchNorm into the preceding Conv)
+            prep_path = os.path.join(work_dir, f"{model_name}.prep.onnx")
+            quant_pre_process(fp32_path, prep_path)
+
+            logger.info(f"Quantizing DenseNet to INT8 with {len(image_paths)} calibration images")
+            quantize_static(
+                prep_path,
+                tmp_int8_path,
+                calibration_data_reader=ChexCalibrationReader(image_paths, self.preprocess),
+                # QDQ graph: ORT fuses QuantizeLinear/DequantizeLinear pairs into QLinearConv.
+                # U8 activations x S8 weights is the x86 fast path (VNNI vpdpbusd / AVX2 vpmaddubsw)
+                quant_format=QuantFormat.QDQ,
+                activation_type=QuantType.QUInt8,
+                weight_type=QuantType.QInt8,
+                per_channel=True,
+                reduce_range=False,
+            )
+        return True
+
+    def _run_onnx(self, batch: np.ndarray) -> torch.Tensor:
+        """Classification forward through ONNX Runtime, binding the input buffer without a copy."""
+        binding = self.session.io_binding()
+        binding.bind_cpu_input(ONNX_INPUT_NAME, batch)
+        binding.bind_output(ONNX_OUTPUT_NAME)
+        self.session.run_with_iobinding(binding)
+        return torch.from_numpy(binding.copy_outputs_to_cpu()[0])
+
+    def _to_device(self, batch: torch.Tensor, staging: bool = True) -> torch.Tensor:
+        if not staging or self._device_buf is None or len(batch) > len(self._device_buf):
+            return batch.to(
+                self.device, dtype=self.dtype, memory_format=self.memory_format, non_blocking=True
+            )
+        device_batch = self._device_buf[:len(batch)]
+        with torch.cuda.stream(self._copy_stream):
+            device_batch.copy_(batch, non_blocking=True)
+        torch.cuda.current_stream(self.device).wait_stream(self._copy_stream)
+        return device_batch
+
+    def preprocess(self, image_bytes: bytes) -> np.ndarray:
+        """
+        Decode, center-crop and resize an upload to the model's [224, 224] uint8 grayscale
+        input (equivalent to xrv's XRayCenterCrop + XRayResizer). Normalization happens
+        when the batch is assembled, directly into the preallocated input buffer.
+        """
+        img = _decode_grayscale(image_bytes)
+        height, width = img.shape
+        side = min(height, width)
+        top, left = (height - side) // 2, (width - side) // 2
+        img = img[top:top + side, left:left + side]
+        if img.shape == MODEL_INPUT_SIZE:
+            return img  # already at model resolution (the batch normalization copies it anyway)
+        return cv2.resize(img, MODEL_INPUT_SIZE, interpolation=cv2.INTER_AREA)
 
     def predict(self, image_bytes: bytes) -> Dict:
         """Run full inference: pathology detection + Grad-CAM + severity triage."""
-        img_tensor = self.preprocess(image_bytes)
-
-        with torch.no_grad():
-            raw_output = self.model(img_tensor)
-
-        probabilities = torch.sigmoid(raw_output).squeeze().cpu().numpy()
-
-        conditions = [
-            {"name": label, "confidence": float(prob)}
-            for label, prob in zip(self.model.pathologies, probabilities)
-            if label in PATHOLOGY_LABELS
-        ]
-        conditions.sort(key=lambda x: x["confidence"], reverse=True)
-
-        # Severity triage
-        severity = self._classify_severity(conditions)
-
-        # Grad-CAM for top condition
-        top_condition_idx = int(np.argmax(probabilities))
-        heatmap = self.grad_cam.generate(img_tensor, top_condition_idx)
-
-        return {
-            "conditions": conditions,
-            "severity": severity,
-            "heatmap": heatmap,
-            "top_condition": conditions[0]["name"] if conditions else "Normal",
-        }
-
-    def _classify_severity(self, conditions: List[Dict]) -> str:
-        if not conditions:
-            return "NORMAL"
-
-        max_conf = conditions[0]["confidence"]
-        top_name = conditions[0]["name"]
+        result = self.predict_batch([self.preprocess(image_bytes)])[0]
+        if not result["is_normal"] and result["heatmap"] is None:
+            result["heatmap"] = self.explain_batch([(result["image"], result["class_index"])])[0]
+        return result
+
+    def predict_batch(self, images: List[np.ndarray]) -> List[Dict]:
+        """
+        Run batched pathology detection + severity triage over preprocessed [224, 224] uint8
+        images. With the eager model the same forward also yields Grad-CAM heatmaps; otherwise
+        abnormal results carry `heatmap=None` and their `class_index` for `explain_batch`.
+        """
+        if len(images) <= len(self._input_buf):
+            batch_array = _normalize_into(images, self._input_buf)
+        else:
+            batch_array = _normalize_into(
+                images, np.empty((len(images), 1, *MODEL_INPUT_SIZE), dtype=np.float32)
+            )
+
+        if self.session is not None:
+            raw_output = self._run_onnx(batch_array)
+        elif self.classifier is not None:
+            with torch.inference_mode():
+                raw_output = self.classifier(self._to_device(torch.from_numpy(batch_array)))
+        else:
+            # Grad-enabled so the same forward can also serve Grad-CAM
+            raw_output = self.grad_cam.forward(self._to_device(torch.from_numpy(batch_array)))
+
+        logits = raw_output.detach().float().cpu()
+        probabilities = torch.sigmoid(logits).numpy()[:, self._pathology_mask]
+        orders = np.argsort(-probabilities, axis=1, kind="stable")
+        class_indices = logits.argmax(dim=1).tolist()
+
+        results = []
+        for probs, order, image, class_index in zip(probabilities, orders, images, class_indices):
+            names = self._pathology_names[order].tolist()
+            confidences = probs[order].tolist()
+
+            # Severity triage
+            severity = self._classify_severity(confidences[0], names[0])
+
+            conditions = [
+                {"name": name, "confidence": confidence}
+                for name, confidence in zip(names, confidences)
+            ]
+
+            results.append({
+                "conditions": conditions,
+                "severity": severity,
+                "is_normal": severity == "NORMAL",
+                "heatmap": None,
+                "image": image,
+                "class_index": class_index,
+                "top_condition": names[0],
+            })
+
+        # Grad-CAM for the top condition, only for scans that have something to explain
+        if self.fused_grad_cam:
+            rows = [i for i, result in enumerate(results) if not result["is_normal"]]
+            if rows:
+                heatmaps = self.grad_cam.generate(
+                    raw_output, torch.tensor(rows), torch.tensor([class_indices[i] for i in rows])
+                )
+                for i, heatmap in zip(rows, heatmaps):
+                    results[i]["heatmap"] = heatmap
+        return results
+
+    def explain_batch(self, items: List[Tuple[np.ndarray, int]]) -> List[np.ndarray]:
+        """
+        Grad-CAM heatmaps for (preprocessed image, class index) pairs, via a grad-enabled
+        forward of the eager model over just these images. Safe to run alongside
+        `predict_batch` when classification is on ONNX Runtime or the compiled model.
+        """
+        images = [image for image, _ in items]
+        batch = _normalize_into(
+            images, np.empty((len(images), 1, *MODEL_INPUT_SIZE), dtype=np.float32)
+        )
+        # Not staged through the shared device buffer, which belongs to predict_batch
+        cam_output = self.grad_cam.forward(self._to_device(torch.from_numpy(batch), staging=False))
+        class_indices = torch.tensor([class_index for _, class_index in items])
+        return list(self.grad_cam.generate(cam_output, torch.arange(len(items)), class_indices))
 
+    def _classify_severity(self, max_conf: float, top_name: str) -> str:
+        """Triage from the highest-confidence condition."""
         if top_name in URGENT_CONDITIONS and max_conf > 0.70:
             return "URGENT"
-        for severity, threshold in SEVERITY_THRESHOLDS.items():
-            if max_conf >= threshold:
-                return severity
-        return "NORMAL"
-
-    def generate_heatmap_overlay(
-        self, original_bytes: bytes, heatmap: np.ndarray
-    ) -> bytes:
-        """Overlay Grad-CAM heatmap on original image and return as PNG bytes."""
-        img = Image.open(io.BytesIO(original_bytes)).convert("RGB")
-        img = img.resize((224, 224))
-        img_array = np.array(img)
-
-        heatmap_colored = cv2.applyColorMap(
-            (heatmap * 255).astype(np.uint8), cv2.COLORMAP_JET
-        )
-        heatmap_colored = cv2.cvtColor(heatmap_colored, cv2.COLOR_BGR2RGB)
-
-        overlay = cv2.addWeighted(img_array, 0.6, heatmap_colored, 0.4, 0)
+        return _SEVERITY_LEVELS[bisect_right(_SEVERITY_BOUNDS, max_conf)]
+
+    def generate_heatmap_overlay(self, image: np.ndarray, heatmap: np.ndarray) -> bytes:
+        """
+        Overlay a uint8 Grad-CAM heatmap on the model's [224, 224] input image (the `image`
+        returned by `predict`) and return it encoded as `settings.HEATMAP_FORMAT`.
+        No decode or model pass.
+        """
+        index = np.left_shift(image, 8, dtype=np.uint16)
+        index |= heatmap
+        return _encode_overlay(index, settings.HEATMAP_FORMAT)
+
+
+def _encode_overlay(index: np.ndarray, fmt: str) -> bytes:
+    """
+    Gather overlay pixels from the LUT in one pass and encode them with OpenCV: libwebp for
+    WebP, libpng at OpenCV's default (fast, RLE-strategy) compression for PNG.
+    """
+    overlay = np.take(OVERLAY_LUT_BGR, index, axis=0)
+    if fmt == "webp":
+        _, buffer = cv2.imencode(".webp", overlay, [cv2.IMWRITE_WEBP_QUALITY, WEBP_QUALITY])
+    else:
         _, buffer = cv2.imencode(".png", overlay)
-        return buffer.tobytes()
+    return buffer.tobytes()
 
 
-# Singleton — loaded once on startup
+# Singleton — loaded once on startup. Callers include the batcher's worker threads, so
+# construction is locked (lru_cache alone would let two first callers both build a model).
 _model_instance = None
+_model_lock = threading.Lock()
 
 
 def get_vision_model() -> MediScanVisionModel:
     global _model_instance
     if _model_instance is None:
-        _model_instance = MediScanVisionModel()
+        with _model_lock:
+            if _model_instance is None:
+                _model_instance = MediScanVisionModel()
     return _model_instance
+
+
+@lru_cache(maxsize=1)
+def get_vision_batcher() -> DynamicBatcher:
+    """Batcher coalescing concurrent preprocessed scans into one DenseNet forward."""
+    return DynamicBatcher(
+        lambda images: get_vision_model().predict_batch(images),
+        name="densenet",
+    )
+
+
+@lru_cache(maxsize=1)
+def get_grad_cam_batcher() -> DynamicBatcher:
+    """Batcher for (image, class index) Grad-CAM requests when classification runs separately."""
+    return DynamicBatcher(
+        lambda items: get_vision_model().explain_batch(items),
+        name="gradcam",
+    )
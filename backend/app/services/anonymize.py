@@ -0,0 +1,140 @@
+"""
+Image anonymisation — strips embedded metadata (EXIF, IPTC, text chunks) from uploads
+Works on the raw container structure, so pixels are never decoded or re-encoded.
+"""
+
+import io
+import logging
+import re
+import struct
+from typing import BinaryIO, Union
+
+logger = logging.getLogger(__name__)
+
+JPEG_SOI = b"\xff\xd8"
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# APP0 (JFIF), APP1 (EXIF / XMP), APP13 (IPTC / Photoshop), COM (free-text comment).
+# APP14 (Adobe) is kept: it carries the colour transform decoders need.
+JPEG_DROP_MARKERS = frozenset({0xE0, 0xE1, 0xED, 0xFE})
+JPEG_SOS = 0xDA
+JPEG_EOI = 0xD9
+# Markers without a length field: TEM, RST0–RST7, SOI, EOI
+JPEG_STANDALONE_MARKERS = frozenset({0x01, *range(0xD0, 0xDA)})
+# A marker that ends entropy-coded data: 0xFF not followed by a stuffed 0x00, an RSTn
+# (which stays inside the scan) or another 0xFF fill byte
+JPEG_SCAN_END = re.compile(rb"\xff[^\x00\xd0-\xd7\xff]")
+SCAN_READ_SIZE = 64 * 1024
+
+PNG_DROP_CHUNKS = frozenset({b"tEXt", b"iTXt", b"zTXt", b"eXIf"})
+PNG_IEND = b"IEND"
+
+
+def _read_exact(src: BinaryIO, size: int, what: str) -> bytes:
+    data = src.read(size)
+    if len(data) != size:
+        raise ValueError(f"Malformed {what}: unexpected end of file")
+    return data
+
+
+def _copy_scan_data(src: BinaryIO, sink: BinaryIO):
+    """Copy entropy-coded scan data to `sink`, leaving `src` at the marker that ends it."""
+    while True:
+        start = src.tell()
+        chunk = src.read(SCAN_READ_SIZE)
+        match = JPEG_SCAN_END.search(chunk)
+        if match:
+            sink.write(chunk[:match.start()])
+            src.seek(start + match.start())
+            return
+        if len(chunk) < SCAN_READ_SIZE:
+            sink.write(chunk)  # truncated scan without EOI
+            return
+        # Hold back a trailing 0xFF: it may be the first half of a marker split across reads
+        keep = len(chunk) - 1 if chunk.endswith(b"\xff") else len(chunk)
+        sink.write(chunk[:keep])
+        src.seek(start + keep)
+
+
+def sanitize_jpeg(src: BinaryIO, sink: BinaryIO):
+    """
+    Copy a JPEG stream to `sink`, skipping metadata segments and everything after EOI
+    (camera trailers, MPO secondary images with their own EXIF). Raises ValueError if
+    malformed.
+    """
+    sink.write(_read_exact(src, len(JPEG_SOI), "JPEG"))
+
+    while True:
+        prefix = src.read(1)
+        if not prefix:
+            break
+        if prefix != b"\xff":
+            raise ValueError(f"Malformed JPEG: expected marker at offset {src.tell() - 1}")
+        # Any number of 0xFF fill bytes may precede a marker
+        marker = src.read(1)
+        while marker == b"\xff":
+            marker = src.read(1)
+        if not marker:
+            raise ValueError("Malformed JPEG: truncated marker")
+        marker = marker[0]
+
+        if marker in JPEG_STANDALONE_MARKERS:
+            sink.write(bytes((0xFF, marker)))
+            if marker == JPEG_EOI:
+                break
+            continue
+
+        length_field = _read_exact(src, 2, "JPEG segment header")
+        (length,) = struct.unpack(">H", length_field)
+        if length < 2:
+            raise ValueError(f"Malformed JPEG: bad segment length at offset {src.tell() - 4}")
+        payload = _read_exact(src, length - 2, "JPEG segment")
+        if marker not in JPEG_DROP_MARKERS:
+            sink.write(bytes((0xFF, marker)))
+            sink.write(length_field)
+            sink.write(payload)
+        if marker == JPEG_SOS:
+            # The scan header is followed by pixel data, up to the next marker (DHT / SOS of
+            # a later progressive scan, or EOI)
+            _copy_scan_data(src, sink)
+
+
+def sanitize_png(src: BinaryIO, sink: BinaryIO):
+    """Copy a PNG stream to `sink`, skipping textual and EXIF chunks. Raises ValueError if malformed."""
+    sink.write(_read_exact(src, len(PNG_SIGNATURE), "PNG"))
+
+    while True:
+        header = src.read(8)
+        if not header:
+            break
+        if len(header) != 8:
+            raise ValueError("Malformed PNG: truncated chunk header")
+        length, chunk_type = struct.unpack(">I4s", header)
+        body = _read_exact(src, length + 4, "PNG chunk")  # data + CRC
+        if chunk_type not in PNG_DROP_CHUNKS:
+            sink.write(header)
+            sink.write(body)
+        if chunk_type == PNG_IEND:
+            break
+
+
+def sanitize_image(src: Union[bytes, BinaryIO]) -> bytes:
+    """
+    Strip metadata from a JPEG or PNG, detected by its signature. `src` may be bytes or a
+    seekable binary stream (e.g. an upload's spooled file), which is read segment by segment
+    so only the cleaned copy is ever held in memory.
+    """
+    if isinstance(src, (bytes, bytearray, memoryview)):
+        src = io.BytesIO(src)
+    signature = src.read(len(PNG_SIGNATURE))
+    src.seek(-len(signature), io.SEEK_CUR)
+
+    sink = io.BytesIO()
+    if signature.startswith(JPEG_SOI):
+        sanitize_jpeg(src, sink)
+    elif signature == PNG_SIGNATURE:
+        sanitize_png(src, sink)
+    else:
+        raise ValueError("Unsupported image format: expected JPEG or PNG")
+    # getvalue() hands over the sink's buffer without copying it
+    return sink.getvalue()
@@ -2,9 +2,54 @@
 HL7 FHIR DiagnosticReport formatter for EMR/EHR integration
 """
 
-import json
-from datetime import datetime
-from typing import Dict, List
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple
+
+import orjson
+
+
+# Fields identical in every report; shared (never mutated) across calls
+_FHIR_TEMPLATE = {
+    "resourceType": "DiagnosticReport",
+    "meta": {
+        "profile": ["http://hl7.org/fhir/StructureDefinition/DiagnosticReport"],
+    },
+    "status": "preliminary",
+    "category": [
+        {
+            "coding": [
+                {
+                    "system": "http://terminology.hl7.org/CodeSystem/v2-0074",
+                    "code": "RAD",
+                    "display": "Radiology",
+                }
+            ]
+        }
+    ],
+    "code": {
+        "coding": [
+            {
+                "system": "http://loinc.org",
+                "code": "24748-6",
+                "display": "Chest X-ray AP and Lateral",
+            }
+        ]
+    },
+}
+
+# (epoch second, formatted timestamp) — replaced as one tuple so readers never see a torn pair
+_timestamp_cache: Tuple[int, str] = (0, "")
+
+
+def _utcnow_iso() -> str:
+    """Current UTC time as an ISO 8601 string with a Z suffix, at one-second resolution."""
+    global _timestamp_cache
+    second = time.time_ns() // 1_000_000_000
+    if second != _timestamp_cache[0]:
+        formatted = datetime.fromtimestamp(second, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        _timestamp_cache = (second, formatted)
+    return _timestamp_cache[1]
 
 
 def generate_fhir_report(
@@ -12,8 +57,8 @@ def generate_fhir_report(
     conditions: List[Dict],
     report_sections: Dict[str, str],
     severity: str,
-) -> str:
-    """Generate an HL7 FHIR R4 DiagnosticReport JSON document."""
+) -> bytes:
+    """Generate an HL7 FHIR R4 DiagnosticReport JSON document (UTF-8 encoded)."""
 
     observations = [
         {
@@ -22,36 +67,13 @@ def generate_fhir_report(
         }
         for i, c in enumerate(conditions[:5])
     ]
+    now = _utcnow_iso()
 
     fhir_report = {
-        "resourceType": "DiagnosticReport",
+        **_FHIR_TEMPLATE,
         "id": scan_id,
-        "meta": {
-            "profile": ["http://hl7.org/fhir/StructureDefinition/DiagnosticReport"],
-        },
-        "status": "preliminary",
-        "category": [
-            {
-                "coding": [
-                    {
-                        "system": "http://terminology.hl7.org/CodeSystem/v2-0074",
-                        "code": "RAD",
-                        "display": "Radiology",
-                    }
-                ]
-            }
-        ],
-        "code": {
-            "coding": [
-                {
-                    "system": "http://loinc.org",
-                    "code": "24748-6",
-                    "display": "Chest X-ray AP and Lateral",
-                }
-            ]
-        },
-        "effectiveDateTime": datetime.utcnow().isoformat() + "Z",
-        "issued": datetime.utcnow().isoformat() + "Z",
+        "effectiveDateTime": now,
+        "issued": now,
         "result": observations,
         "conclusion": report_sections.get("impression", ""),
         "conclusionCode": [
@@ -80,7 +102,7 @@ def generate_fhir_report(
         ],
     }
 
-    return json.dumps(fhir_report, indent=2)
+    return orjson.dumps(fhir_report, option=orjson.OPT_INDENT_2)
 
 
 def _build_text_report(sections: Dict[str, str]) -> str:
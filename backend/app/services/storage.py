@@ -3,36 +3,108 @@ Azure Blob Storage service — AES-256 encrypted image persistence (HIPAA §164.
 Images auto-deleted after 30 days via Azure lifecycle policy.
 """
 
+import asyncio
 import logging
+from functools import lru_cache
 from typing import Optional
 from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
 try:
-    from azure.storage.blob import BlobServiceClient, ContentSettings
+    import aiohttp
+    from azure.core.pipeline.transport import AioHttpTransport
+    from azure.storage.blob import BlobType, ContentSettings
+    from azure.storage.blob.aio import BlobServiceClient
     AZURE_AVAILABLE = True
 except ImportError:
     AZURE_AVAILABLE = False
-    logger.warning("azure-storage-blob not installed. Using local fallback.")
+    logger.warning("azure-storage-blob / aiohttp not installed. Only local storage mode is available.")
+
+# Pooled keep-alive connections to the storage endpoint, so uploads skip the TLS handshake
+HTTP_POOL_SIZE = 64
+DNS_CACHE_TTL_S = 300
+KEEPALIVE_TIMEOUT_S = 60
+CONNECTION_TIMEOUT_S = 5
+READ_TIMEOUT_S = 10
+UPLOAD_MAX_CONCURRENCY = 4
+# Payloads above this are staged as parallel blocks of this size instead of a single PUT
+UPLOAD_BLOCK_SIZE = 4 * 1024 * 1024
 
 
 class StorageService:
+    """
+    Async Azure Blob client over a shared aiohttp connection pool. The pool is bound to
+    the event loop, so the client is opened by `start()` (called from the app lifespan,
+    or lazily on first upload) rather than in the constructor. Local mode is used only
+    when no connection string is configured; if Azure is configured but the client
+    cannot be opened, `start()` raises and the next call retries.
+    """
+
     def __init__(self):
-        if AZURE_AVAILABLE and settings.AZURE_STORAGE_CONNECTION_STRING:
-            self.client = BlobServiceClient.from_connection_string(
-                settings.AZURE_STORAGE_CONNECTION_STRING
+        self.client: Optional["BlobServiceClient"] = None
+        self.container = settings.AZURE_CONTAINER_NAME
+        self._session: Optional["aiohttp.ClientSession"] = None
+        self._started = False
+        # Concurrent lazy callers wait for the first one's setup instead of racing past it
+        self._start_lock = asyncio.Lock()
+
+    async def start(self):
+        if self._started:
+            return
+        async with self._start_lock:
+            if self._started:
+                return
+            if not settings.AZURE_STORAGE_CONNECTION_STRING:
+                logger.warning("⚠️  Running in local storage mode (development only)")
+                self._started = True
+                return
+            if not AZURE_AVAILABLE:
+                raise RuntimeError(
+                    "AZURE_STORAGE_CONNECTION_STRING is set but azure-storage-blob / aiohttp "
+                    "are not installed"
+                )
+
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=HTTP_POOL_SIZE,
+                    ttl_dns_cache=DNS_CACHE_TTL_S,
+                    keepalive_timeout=KEEPALIVE_TIMEOUT_S,
+                )
             )
-            self.container = settings.AZURE_CONTAINER_NAME
-            self._ensure_container()
+            try:
+                self.client = BlobServiceClient.from_connection_string(
+                    settings.AZURE_STORAGE_CONNECTION_STRING,
+                    transport=AioHttpTransport(
+                        session=self._session,
+                        session_owner=False,
+                        connection_timeout=CONNECTION_TIMEOUT_S,
+                        read_timeout=READ_TIMEOUT_S,
+                        connection_verify=True,
+                    ),
+                    max_single_put_size=UPLOAD_BLOCK_SIZE,
+                    max_block_size=UPLOAD_BLOCK_SIZE,
+                )
+                await self._ensure_container()
+            except Exception:
+                await self.close()  # leave nothing half-open; the next start() retries
+                raise
+            # Only now may callers skip start() — a failed setup must never look like local mode
+            self._started = True
             logger.info("✅ Azure Blob Storage connected")
-        else:
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.close()
             self.client = None
-            logger.warning("⚠️  Running in local storage mode (development only)")
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        self._started = False
 
-    def _ensure_container(self):
+    async def _ensure_container(self):
         try:
-            self.client.create_container(self.container)
+            await self.client.create_container(self.container)
         except Exception:
             pass  # Container already exists
 
@@ -42,6 +114,7 @@ class StorageService:
         blob_name: str,
         content_type: str = "application/octet-stream",
     ) -> Optional[str]:
+        await self.start()
         if not self.client:
             logger.warning(f"Local mode: skipping upload of {blob_name}")
             return f"local://{blob_name}"
@@ -49,32 +122,32 @@ class StorageService:
         blob_client = self.client.get_blob_client(
             container=self.container, blob=blob_name
         )
-        blob_client.upload_blob(
+        await blob_client.upload_blob(
             data,
+            blob_type=BlobType.BlockBlob,
+            length=len(data),
             overwrite=True,
+            max_concurrency=UPLOAD_MAX_CONCURRENCY,
             content_settings=ContentSettings(content_type=content_type),
         )
         return blob_client.url
 
     async def delete_blob(self, blob_name: str) -> bool:
+        await self.start()
         if not self.client:
             return False
         try:
             blob_client = self.client.get_blob_client(
                 container=self.container, blob=blob_name
             )
-            blob_client.delete_blob()
+            await blob_client.delete_blob()
             return True
         except Exception as e:
             logger.error(f"Failed to delete blob {blob_name}: {e}")
             return False
 
 
-_storage_instance = None
-
-
+@lru_cache(maxsize=1)
 def get_storage_service() -> StorageService:
-    global _storage_instance
-    if _storage_instance is None:
-        _storage_instance = StorageService()
-    return _storage_instance
+    # Construction only records settings; the client itself is opened by start()
+    return StorageService()
@@ -5,15 +5,32 @@ pytest + pytest-asyncio + httpx
 
 import pytest
 from fastapi.testclient import TestClient
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
+import asyncio
+import json
 import io
 from PIL import Image
 
+from app.core.security import create_access_token
 from app.main import app
 
 client = TestClient(app)
 
 
+# ─── Fixtures ────────────────────────────────────────────────────────────────
+
+@pytest.fixture(scope="session")
+def test_image() -> bytes:
+    """Minimal grayscale JPEG, encoded once per test session."""
+    return _create_test_image()
+
+
+@pytest.fixture(scope="session")
+def auth_headers() -> dict:
+    token = create_access_token({"sub": "test-user", "role": "clinician"})
+    return {"Authorization": f"Bearer {token}"}
+
+
 # ─── Health Check ────────────────────────────────────────────────────────────
 
 def test_health_check():
@@ -25,76 +42,108 @@ def test_health_check():
     assert "disclaimer" in data
 
 
+def test_health_probes_skip_request_tracing():
+    assert "X-Request-ID" not in client.get("/api/v1/health").headers
+    assert "X-Request-ID" in client.get("/api/v1/reports/some-scan").headers
+
+
 # ─── Auth ────────────────────────────────────────────────────────────────────
 
-def test_analyze_requires_auth():
+def test_login_demo_user():
+    response = client.post(
+        "/api/v1/auth/login", json={"email": "demo@mediscan.ai", "password": "demo1234"}
+    )
+    assert response.status_code == 200
+    assert response.json()["token_type"] == "bearer"
+
+
+def test_login_rejects_wrong_password():
+    response = client.post(
+        "/api/v1/auth/login", json={"email": "demo@mediscan.ai", "password": "wrong"}
+    )
+    assert response.status_code == 401
+
+
+def test_analyze_requires_auth(test_image):
     """Endpoint must reject requests without a Bearer token."""
-    img = _create_test_image()
-    response = client.post("/api/v1/analyze", files={"file": ("test.jpg", img, "image/jpeg")})
+    response = client.post(
+        "/api/v1/analyze", files={"file": ("test.jpg", test_image, "image/jpeg")}
+    )
     assert response.status_code == 403
 
 
-def test_analyze_rejects_invalid_file_type():
+def test_analyze_rejects_invalid_file_type(auth_headers):
     """Non-image file types must be rejected with 415."""
-    from app.core.security import create_access_token
-    token = create_access_token({"sub": "test-user", "role": "clinician"})
-    headers = {"Authorization": f"Bearer {token}"}
     response = client.post(
         "/api/v1/analyze",
         files={"file": ("report.pdf", b"PDF content", "application/pdf")},
-        headers=headers,
+        headers=auth_headers,
     )
     assert response.status_code == 415
 
 
+def test_analyze_rejects_oversized_file(auth_headers):
+    """Uploads over 10MB are rejected with 413 before any decoding."""
+    payload = b"\xff\xd8" + bytes(10 * 1024 * 1024)
+    response = client.post(
+        "/api/v1/analyze",
+        files={"file": ("xray.jpg", payload, "image/jpeg")},
+        headers=auth_headers,
+    )
+    assert response.status_code == 413
+
+
 # ─── Vision Model Mocked ─────────────────────────────────────────────────────
 
 @patch("app.api.v1.analyze.get_vision_model")
-@patch("app.api.v1.analyze.get_report_generator")
+@patch("app.api.v1.analyze.get_vision_batcher")
+@patch("app.api.v1.analyze.get_report_batcher")
 @patch("app.api.v1.analyze.get_storage_service")
-def test_analyze_success(mock_storage, mock_report_gen, mock_vision):
+def test_analyze_success(
+    mock_storage, mock_report_batcher, mock_vision_batcher, mock_vision, test_image, auth_headers
+):
     """Full pipeline returns expected response shape with mocked models."""
-    from app.core.security import create_access_token
     import numpy as np
 
     # Mock vision model
     mock_vm = MagicMock()
-    mock_vm.predict.return_value = {
+    mock_vm.generate_heatmap_overlay.return_value = b"fake-png-bytes"
+    mock_vision.return_value = mock_vm
+
+    mock_vb = MagicMock()
+    mock_vb.submit = AsyncMock(return_value={
         "conditions": [
             {"name": "Pneumonia", "confidence": 0.87},
             {"name": "Pleural Effusion", "confidence": 0.43},
         ],
         "severity": "URGENT",
-        "heatmap": np.zeros((224, 224)),
+        "is_normal": False,
+        "heatmap": np.zeros((224, 224), dtype=np.uint8),
+        "image": np.zeros((224, 224), dtype=np.uint8),
         "top_condition": "Pneumonia",
-    }
-    mock_vm.generate_heatmap_overlay.return_value = b"fake-png-bytes"
-    mock_vision.return_value = mock_vm
+    })
+    mock_vision_batcher.return_value = mock_vb
 
     # Mock report generator
-    mock_rg = MagicMock()
-    mock_rg.generate_report.return_value = {
+    mock_rb = MagicMock()
+    mock_rb.submit = AsyncMock(return_value={
         "technique": "PA chest X-ray.",
         "findings": "Opacity in right lower lobe.",
         "impression": "Findings consistent with Pneumonia.",
         "recommendation": "URGENT: Immediate clinical review.",
         "disclaimer": "For research use only.",
-    }
-    mock_report_gen.return_value = mock_rg
+    })
+    mock_report_batcher.return_value = mock_rb
 
     # Mock storage
     mock_ss = MagicMock()
-    mock_ss.upload_bytes = MagicMock(return_value="https://storage.azure.com/fake")
+    mock_ss.upload_bytes = AsyncMock(return_value="https://storage.azure.com/fake")
     mock_storage.return_value = mock_ss
 
-    token = create_access_token({"sub": "test-user", "role": "clinician"})
-    headers = {"Authorization": f"Bearer {token}"}
-    img = _create_test_image()
-
     response = client.post(
         "/api/v1/analyze",
-        files={"file": ("xray.jpg", img, "image/jpeg")},
-        headers=headers,
+        files={"file": ("xray.jpg", test_image, "image/jpeg")},
+        headers=auth_headers,
     )
 
     assert response.status_code == 200
@@ -104,6 +153,340 @@ def test_analyze_success(mock_storage, mock_report_gen, mock_vision):
     assert len(data["conditions"]) == 2
     assert "report" in data
     assert "findings" in data["report"]
+    assert data["heatmap_url"] == "https://storage.azure.com/fake"
+    assert mock_ss.upload_bytes.await_count == 3  # original + heatmap + FHIR
+
+
+@patch("app.api.v1.analyze.get_vision_model")
+@patch("app.api.v1.analyze.get_vision_batcher")
+@patch("app.api.v1.analyze.get_grad_cam_batcher")
+@patch("app.api.v1.analyze.get_report_batcher")
+@patch("app.api.v1.analyze.get_storage_service")
+def test_analyze_runs_deferred_grad_cam(
+    mock_storage, mock_report_batcher, mock_grad_cam_batcher, mock_vision_batcher, mock_vision,
+    test_image, auth_headers,
+):
+    """When classification returns no heatmap, Grad-CAM is requested for the top class."""
+    from app.models.biogpt import NORMAL_REPORT
+    import numpy as np
+
+    mock_vm = MagicMock()
+    mock_vm.generate_heatmap_overlay.return_value = b"fake-png-bytes"
+    mock_vision.return_value = mock_vm
+    image = np.zeros((224, 224), dtype=np.uint8)
+    mock_vb = MagicMock()
+    mock_vb.submit = AsyncMock(return_value={
+        "conditions": [{"name": "Pneumonia", "confidence": 0.55}],
+        "severity": "MODERATE",
+        "is_normal": False,
+        "heatmap": None,
+        "image": image,
+        "class_index": 3,
+        "top_condition": "Pneumonia",
+    })
+    mock_vision_batcher.return_value = mock_vb
+    heatmap = np.full((224, 224), 255, dtype=np.uint8)
+    mock_gb = MagicMock()
+    mock_gb.submit = AsyncMock(return_value=heatmap)
+    mock_grad_cam_batcher.return_value = mock_gb
+    mock_rb = MagicMock()
+    mock_rb.submit = AsyncMock(return_value=NORMAL_REPORT)
+    mock_report_batcher.return_value = mock_rb
+    mock_ss = MagicMock()
+    mock_ss.upload_bytes = AsyncMock(return_value="https://storage.azure.com/fake")
+    mock_storage.return_value = mock_ss
+
+    response = client.post(
+        "/api/v1/analyze",
+        files={"file": ("xray.jpg", test_image, "image/jpeg")},
+        headers=auth_headers,
+    )
+
+    assert response.status_code == 200
+    mock_gb.submit.assert_awaited_once_with((image, 3))
+    mock_vm.generate_heatmap_overlay.assert_called_once_with(image, heatmap)
+    assert response.json()["heatmap_url"] == "https://storage.azure.com/fake"
+
+
+@patch("app.api.v1.analyze.get_vision_model")
+@patch("app.api.v1.analyze.get_vision_batcher")
+@patch("app.api.v1.analyze.get_report_batcher")
+@patch("app.api.v1.analyze.get_storage_service")
+def test_analyze_normal_scan_skips_heatmap_and_biogpt(
+    mock_storage, mock_report_batcher, mock_vision_batcher, mock_vision, test_image, auth_headers
+):
+    """NORMAL scans skip the overlay, BioGPT, and the heatmap upload."""
+    from app.models.biogpt import NORMAL_REPORT
+    import numpy as np
+
+    mock_vm = MagicMock()
+    mock_vision.return_value = mock_vm
+    mock_vb = MagicMock()
+    mock_vb.submit = AsyncMock(return_value={
+        "conditions": [{"name": "Edema", "confidence": 0.12}],
+        "severity": "NORMAL",
+        "is_normal": True,
+        "heatmap": None,
+        "image": np.zeros((224, 224), dtype=np.uint8),
+        "top_condition": "Edema",
+    })
+    mock_vision_batcher.return_value = mock_vb
+    mock_rb = MagicMock()
+    mock_rb.submit = AsyncMock()
+    mock_report_batcher.return_value = mock_rb
+    mock_ss = MagicMock()
+    mock_ss.upload_bytes = AsyncMock(return_value="https://storage.azure.com/fake")
+    mock_storage.return_value = mock_ss
+
+    response = client.post(
+        "/api/v1/analyze",
+        files={"file": ("xray.jpg", test_image, "image/jpeg")},
+        headers=auth_headers,
+    )
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["severity"] == "NORMAL"
+    assert data["heatmap_url"] is None
+    assert data["report"]["findings"] == NORMAL_REPORT["findings"]
+    mock_vm.generate_heatmap_overlay.assert_not_called()
+    mock_rb.submit.assert_not_called()
+    assert mock_ss.upload_bytes.await_count == 2  # original + FHIR
+
+
+@patch("app.api.v1.analyze.get_vision_model")
+@patch("app.api.v1.analyze.get_vision_batcher")
+@patch("app.api.v1.analyze.get_report_batcher")
+@patch("app.api.v1.analyze.get_storage_service")
+def test_analyze_failure_cancels_inflight_uploads(
+    mock_storage, mock_report_batcher, mock_vision_batcher, mock_vision, test_image, auth_headers
+):
+    """A failed analysis cancels every upload it started, including the heatmap."""
+    from app.models.biogpt import NORMAL_REPORT
+    import numpy as np
+
+    mock_vm = MagicMock()
+    mock_vm.generate_heatmap_overlay.return_value = b"fake-png-bytes"
+    mock_vision.return_value = mock_vm
+    mock_vb = MagicMock()
+    mock_vb.submit = AsyncMock(return_value={
+        "conditions": [{"name": "Pneumonia", "confidence": 0.87}],
+        "severity": "URGENT",
+        "is_normal": False,
+        "heatmap": np.zeros((224, 224), dtype=np.uint8),
+        "image": np.zeros((224, 224), dtype=np.uint8),
+        "top_condition": "Pneumonia",
+    })
+    mock_vision_batcher.return_value = mock_vb
+    mock_rb = MagicMock()
+    mock_rb.submit = AsyncMock(return_value=NORMAL_REPORT)
+    mock_report_batcher.return_value = mock_rb
+
+    started, cancelled = set(), []
+
+    async def slow_upload(data, blob_name, content_type):
+        name = blob_name.split("/", 1)[1]
+        if name == "report.fhir.json":
+            # Fail only once the other uploads are actually running
+            for _ in range(100):
+                if len(started) == 2:
+                    break
+                await asyncio.sleep(0)
+            raise RuntimeError("FHIR upload failed")
+        started.add(name)
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(name)
+            raise
+
+    mock_ss = MagicMock()
+    mock_ss.upload_bytes = slow_upload
+    mock_storage.return_value = mock_ss
+
+    response = client.post(
+        "/api/v1/analyze",
+        files={"file": ("xray.jpg", test_image, "image/jpeg")},
+        headers=auth_headers,
+    )
+
+    assert response.status_code == 500
+    assert sorted(cancelled) == ["heatmap.webp", "original.jpg"]
+
+
+# ─── Dynamic Batching ────────────────────────────────────────────────────────
+
+def test_batcher_coalesces_concurrent_requests():
+    """Concurrent submissions within the wait window share one batch_fn call."""
+    from app.models.batching import DynamicBatcher
+
+    calls = []
+
+    def batch_fn(items):
+        calls.append(list(items))
+        return [item * 2 for item in items]
+
+    async def run():
+        batcher = DynamicBatcher(batch_fn, name="test", max_batch_size=8, max_wait_ms=50)
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(5)))
+        await batcher.stop()
+        return results
+
+    assert asyncio.run(run()) == [0, 2, 4, 6, 8]
+    assert calls == [[0, 1, 2, 3, 4]]
+
+
+def test_batcher_fails_requests_when_batch_fn_drops_results():
+    """A short result list fails every request in the batch instead of hanging any of them."""
+    from app.models.batching import DynamicBatcher
+
+    async def run():
+        batcher = DynamicBatcher(lambda items: items[:1], name="test", max_wait_ms=50)
+        results = await asyncio.wait_for(
+            asyncio.gather(*(batcher.submit(i) for i in range(3)), return_exceptions=True), 5
+        )
+        await batcher.stop()
+        return results
+
+    results = asyncio.run(run())
+    assert len(results) == 3
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+# ─── Report Generation ───────────────────────────────────────────────────────
+
+def test_report_findings_cached_for_repeat_conditions():
+    """Repeat condition sets reuse cached findings instead of re-running BioGPT."""
+    from collections import OrderedDict
+    from app.models.biogpt import BioGPTReportGenerator
+
+    gen = BioGPTReportGenerator.__new__(BioGPTReportGenerator)
+    gen._findings_cache = OrderedDict()
+    gen._greedy_generate = MagicMock(return_value=[" a right lower lobe opacity"])
+
+    conditions = [{"name": "Pneumonia", "confidence": 0.87}]
+    first = gen.generate_report(conditions, "URGENT")
+    second = gen.generate_report(conditions, "URGENT")
+
+    assert first == second
+    assert first["findings"] == "a right lower lobe opacity."
+    gen._greedy_generate.assert_called_once()
+
+
+def test_report_normal_scan_skips_generation():
+    from app.models.biogpt import BioGPTReportGenerator, NORMAL_REPORT
+
+    gen = BioGPTReportGenerator.__new__(BioGPTReportGenerator)
+    gen._greedy_generate = MagicMock()
+    report = gen.generate_report([{"name": "Edema", "confidence": 0.12}], "NORMAL")
+
+    assert report == NORMAL_REPORT
+    gen._greedy_generate.assert_not_called()
+
+
+# ─── Audit Logging ───────────────────────────────────────────────────────────
+
+def test_audit_events_are_queued_until_flushed(caplog):
+    import logging
+    from app.core.logging import AUDIT_QUEUE, flush_audit_queue, log_audit_event
+
+    with caplog.at_level(logging.INFO, logger="mediscan.audit"):
+        log_audit_event("user-1", "analyze", "/api/v1/analyze", "127.0.0.1", 200, scan_id="s-1")
+        log_audit_event("user-2", "login", "/api/v1/auth/login", "127.0.0.1", 401)
+        assert not caplog.records
+        flush_audit_queue()
+
+    assert not AUDIT_QUEUE
+    lines = caplog.records[-1].getMessage().splitlines()
+    assert [json.loads(line)["user_id"] for line in lines] == ["user-1", "user-2"]
+    assert json.loads(lines[0])["timestamp"].endswith("Z")
+
+
+def test_audit_queue_flushes_inline_instead_of_dropping(caplog, monkeypatch):
+    """A backed-up queue is written out by the request that fills it, never evicted."""
+    import logging
+    from app.core import logging as audit
+    monkeypatch.setattr(audit, "AUDIT_FLUSH_THRESHOLD", 3)
+
+    with caplog.at_level(logging.INFO, logger="mediscan.audit"):
+        for i in range(3):
+            audit.log_audit_event(f"user-{i}", "analyze", "/api/v1/analyze", "127.0.0.1", 200)
+
+    assert not audit.AUDIT_QUEUE
+    lines = caplog.records[-1].getMessage().splitlines()
+    assert [json.loads(line)["user_id"] for line in lines] == ["user-0", "user-1", "user-2"]
+
+
+# ─── Anonymisation ───────────────────────────────────────────────────────────
+
+def test_sanitize_jpeg_strips_exif():
+    """EXIF segments are dropped without touching the image data."""
+    from app.services.anonymize import sanitize_image
+
+    exif = Image.Exif()
+    exif[0x010E] = "PATIENT: Jane Doe"  # ImageDescription
+    original = _create_test_image(exif=exif)
+    assert b"Jane Doe" in original
+
+    cleaned = sanitize_image(original)
+    assert b"Jane Doe" not in cleaned
+    assert not Image.open(io.BytesIO(cleaned)).getexif()
+    assert Image.open(io.BytesIO(cleaned)).tobytes() == Image.open(io.BytesIO(original)).tobytes()
+
+
+def test_sanitize_jpeg_drops_data_after_eoi():
+    """Trailers after EOI (camera data, MPO secondary images) never survive sanitisation."""
+    from app.services.anonymize import sanitize_image
+
+    original = _create_test_image()
+    cleaned = sanitize_image(original + b"PATIENT-TRAILER Jane Doe")
+    assert b"Jane Doe" not in cleaned
+    assert cleaned.endswith(b"\xff\xd9")
+    assert Image.open(io.BytesIO(cleaned)).tobytes() == Image.open(io.BytesIO(original)).tobytes()
+
+
+def test_sanitize_progressive_jpeg_keeps_every_scan():
+    from app.services.anonymize import sanitize_image
+
+    original = _create_test_image(progressive=True)
+    cleaned = sanitize_image(original + b"\xff\xd8trailer")
+    assert Image.open(io.BytesIO(cleaned)).tobytes() == Image.open(io.BytesIO(original)).tobytes()
+
+
+def test_sanitize_png_strips_text_chunks():
+    from PIL.PngImagePlugin import PngInfo
+    from app.services.anonymize import sanitize_image
+
+    info = PngInfo()
+    info.add_text("Patient", "Jane Doe")
+    buf = io.BytesIO()
+    Image.new("L", (64, 64), color=128).save(buf, format="PNG", pnginfo=info)
+
+    cleaned = sanitize_image(buf.getvalue())
+    assert b"Jane Doe" not in cleaned
+    assert Image.open(io.BytesIO(cleaned)).size == (64, 64)
+
+
+def test_sanitize_rejects_unknown_format():
+    from app.services.anonymize import sanitize_image
+
+    with pytest.raises(ValueError):
+        sanitize_image(b"PDF content")
+
+
+# ─── Storage ─────────────────────────────────────────────────────────────────
+
+def test_storage_configured_but_unavailable_raises_instead_of_local_mode(monkeypatch):
+    """With Azure configured, a failed client setup must not fall back to fake local URLs."""
+    from app.services import storage
+
+    monkeypatch.setattr(storage.settings, "AZURE_STORAGE_CONNECTION_STRING", "AccountName=x")
+    monkeypatch.setattr(storage, "AZURE_AVAILABLE", False)
+    service = storage.StorageService()
+
+    for _ in range(2):  # not marked started by the first failure
+        with pytest.raises(RuntimeError):
+            asyncio.run(service.upload_bytes(b"data", "scan/original.jpg"))
 
 
 # ─── FHIR Output ─────────────────────────────────────────────────────────────
@@ -131,6 +514,8 @@ def test_fhir_report_structure():
     assert report["status"] == "preliminary"
     assert "conclusion" in report
     assert "presentedForm" in report
+    assert report["issued"] == report["effectiveDateTime"]
+    assert report["issued"].endswith("Z")
 
 
 # ─── Severity Classification ──────────────────────────────────────────────────
@@ -138,25 +523,89 @@ def test_fhir_report_structure():
 def test_severity_urgent_for_pneumothorax():
     from app.models.densenet import MediScanVisionModel
     model = MediScanVisionModel.__new__(MediScanVisionModel)
-    severity = model._classify_severity([
-        {"name": "Pneumothorax", "confidence": 0.75},
-    ])
+    severity = model._classify_severity(0.75, "Pneumothorax")
     assert severity == "URGENT"
 
 
-def test_severity_normal_when_no_conditions():
+def test_severity_normal_below_mild_threshold():
     from app.models.densenet import MediScanVisionModel
     model = MediScanVisionModel.__new__(MediScanVisionModel)
-    severity = model._classify_severity([])
+    severity = model._classify_severity(0.12, "Pneumonia")
     assert severity == "NORMAL"
 
 
+def test_severity_thresholds_are_inclusive_lower_bounds():
+    from app.models.densenet import MediScanVisionModel
+    model = MediScanVisionModel.__new__(MediScanVisionModel)
+    expected = {
+        0.0: "NORMAL", 0.29: "NORMAL", 0.30: "MILD", 0.50: "MODERATE",
+        0.69: "MODERATE", 0.70: "SEVERE", 0.85: "URGENT", 1.0: "URGENT",
+    }
+    for confidence, severity in expected.items():
+        assert model._classify_severity(confidence, "Mass") == severity
+
+
+# ─── Model Cache ─────────────────────────────────────────────────────────────
+
+def test_model_cache_dir_is_created_private(tmp_path, monkeypatch):
+    import os
+    from app.models import cache
+
+    path = tmp_path / "models"
+    monkeypatch.setattr(cache.settings, "MODEL_CACHE_DIR", str(path))
+    assert cache.model_cache_dir() == str(path)
+    assert os.stat(path).st_mode & 0o077 == 0
+
+
+def test_model_cache_dir_rejects_world_writable_dir(tmp_path, monkeypatch):
+    """A pre-created shared directory (e.g. under /tmp) must not be loaded from."""
+    from app.models import cache
+
+    path = tmp_path / "models"
+    path.mkdir()
+    path.chmod(0o777)
+    monkeypatch.setattr(cache.settings, "MODEL_CACHE_DIR", str(path))
+    with pytest.raises(PermissionError):
+        cache.model_cache_dir()
+
+
+# ─── Heatmap Overlay ─────────────────────────────────────────────────────────
+
+@pytest.mark.parametrize("fmt", ["png", "webp"])
+def test_encode_overlay_round_trips_for_each_heatmap_format(fmt):
+    import cv2
+    import numpy as np
+    from app.models.densenet import HEATMAP_CONTENT_TYPES, OVERLAY_LUT_BGR, _encode_overlay
+
+    assert fmt in HEATMAP_CONTENT_TYPES
+    image = np.tile(np.arange(224, dtype=np.uint8), (224, 1))
+    heatmap = image.T.copy()
+    index = np.left_shift(image, 8, dtype=np.uint16) | heatmap
+
+    decoded = cv2.imdecode(np.frombuffer(_encode_overlay(index, fmt), np.uint8), cv2.IMREAD_COLOR)
+    assert decoded.shape == (224, 224, 3)
+    expected = OVERLAY_LUT_BGR[index]
+    if fmt == "png":
+        assert np.array_equal(decoded, expected)  # lossless
+    else:
+        assert np.abs(decoded.astype(int) - expected).mean() < 8
+
+
+def test_heatmap_format_is_validated_at_startup():
+    from pydantic import ValidationError
+    from app.core.config import Settings
+
+    with pytest.raises(ValidationError):
+        Settings(HEATMAP_FORMAT="gif")
+
+
 # ─── Helpers ─────────────────────────────────────────────────────────────────
 
-def _create_test_image() -> bytes:
-    """Create a minimal grayscale JPEG for testing."""
+def _create_test_image(**save_kwargs) -> bytes:
+    """Create a minimal grayscale JPEG for testing (use the `test_image` fixture when no
+    custom save options are needed)."""
     img = Image.new("L", (224, 224), color=128)
     buf = io.BytesIO()
-    img.save(buf, format="JPEG")
+    img.save(buf, format="JPEG", **save_kwargs)
     buf.seek(0)
     return buf.read()